@@ -9,5 +9,6 @@ from example import views
 
 urlpatterns = patterns('',
     url(r'^$', TemplateView.as_view(template_name='home.html'), name='home'),
-    url(r'^a/$', views.view_a, name='a')
+    url(r'^a/$', views.view_a, name='a'),
+    url(r'^template_debug/', include('template_debug.urls')),
 )
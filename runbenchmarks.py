@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Run the benchmarks in template_debug/tests/benchmarks.py and compare them to
+the baselines stored for the installed versions of Python and Django. Exits
+with an error if a benchmark regressed by more than the threshold.
+
+    python runbenchmarks.py --save      # Record baselines
+    python runbenchmarks.py             # Compare to the baselines
+    python runbenchmarks.py details     # Only run benchmarks named *details*
+"""
+import os
+import sys
+from optparse import OptionParser
+
+# Use the example.settings as the default settings module for benchmarks
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+
+import django
+
+# For Django1.7, load everything
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.conf import settings
+from django.test.utils import get_runner, setup_test_environment
+
+
+def runbenchmarks():
+    parser = OptionParser(usage='%prog [options] [name ...]')
+    parser.add_option('--baselines', default='benchmarks.json',
+                      help='file of baselines [default: %default]')
+    parser.add_option('--save', action='store_true', default=False,
+                      help='store the results as the new baselines')
+    parser.add_option('--threshold', type='float', default=None,
+                      help='fraction of a baseline that a result may regress')
+    options, names = parser.parse_args()
+
+    from template_debug.tests import benchmarks
+    threshold = options.threshold
+    if threshold is None:
+        threshold = benchmarks.THRESHOLD
+
+    setup_test_environment()
+    test_runner = get_runner(settings)(verbosity=0, interactive=False)
+    old_config = test_runner.setup_databases()
+    try:
+        results = benchmarks.run_benchmarks(names)
+    finally:
+        test_runner.teardown_databases(old_config)
+
+    baselines = benchmarks.load_baselines(options.baselines)
+    for name, result in sorted(results.items()):
+        baseline = baselines.get(name, {})
+        peak_bytes = result['peak_bytes']
+        sys.stdout.write('{0:<32} {1:>12.1f} ops/s {2:>12} bytes'.format(
+            name, result['ops'], 'n/a' if peak_bytes is None else peak_bytes))
+        if baseline:
+            sys.stdout.write('  ({0:+.1%} ops/s)'.format(
+                result['ops'] / baseline['ops'] - 1))
+        sys.stdout.write('\n')
+
+    if options.save:
+        benchmarks.save_baselines(options.baselines, results)
+        return 0
+    regressions = benchmarks.compare(results, baselines, threshold)
+    for name, measure, baseline, result in regressions:
+        sys.stdout.write('Regression in {0} {1}: {2} -> {3}\n'.format(
+            name, measure, baseline, result))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(runbenchmarks())
@@ -0,0 +1,276 @@
+"""
+Static analysis of templates, which are parsed but never rendered.
+"""
+
+from __future__ import unicode_literals
+import io
+import json
+import os
+from multiprocessing import Pool, cpu_count
+
+from django.conf import settings
+from django.template.base import (FilterExpression, Node, NodeList, Template,
+    Variable)
+from django.template.defaulttags import ForNode
+try:
+    from django.template.engine import Engine
+except ImportError:
+    # Django < 1.8
+    from django.template.loader import find_template_loader
+    Engine = None
+
+from template_debug.loaders import LineNumbers, strip_debug_tags
+
+
+# Changing how templates are analyzed must change this, so that results
+# cached by older versions are not used
+ANALYSIS_VERSION = 1
+
+# Default location of the cache of analyses, keyed by path and mtime
+ANALYSIS_CACHE = '.template_debug_analysis.json'
+
+# Modules of the objects, such as the conditions of {% if %}, that are
+# searched for variables along with the attributes of nodes
+TEMPLATE_MODULES = ('django.template', 'django.templatetags')
+
+
+def get_template_loaders():
+    """Return the configured template loaders, without wrapping loaders"""
+    if Engine is not None:
+        loaders = list(Engine.get_default().template_loaders)
+    else:
+        loaders = [find_template_loader(loader)
+                   for loader in settings.TEMPLATE_LOADERS]
+    flat = []
+    while loaders:
+        loader = loaders.pop(0)
+        # Cached and wrapping loaders delegate to other loaders
+        inner = getattr(loader, 'loaders', None)
+        if inner is not None:
+            loaders[:0] = inner
+        elif loader is not None:
+            flat.append(loader)
+    return flat
+
+
+def find_templates(loaders=None):
+    """
+    Given template loaders, which default to the configured loaders, return
+    a list of (template name, path) tuples for every file in the directories
+    they load templates from. A name found by more than one loader or
+    directory is only listed for the first, which the loaders would use.
+    """
+    if loaders is None:
+        loaders = get_template_loaders()
+    templates = []
+    names = set()
+    for loader in loaders:
+        # Asking for the empty name lists the directories that are searched
+        get_template_sources = getattr(loader, 'get_template_sources', None)
+        if get_template_sources is None:
+            continue
+        for directory in get_template_sources(''):
+            # Django >= 1.9 generates origins
+            directory = getattr(directory, 'name', directory)
+            for root, dirs, files in os.walk(directory):
+                dirs.sort()
+                for filename in sorted(files):
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, directory).replace(
+                        os.sep, '/')
+                    if name not in names:
+                        names.add(name)
+                        templates.append((name, path))
+    return templates
+
+
+def analyze_template(name_and_path):
+    """
+    Given a tuple of a template name and path, parse the template and return
+    a dictionary with its 'name', 'path', the 'lookups' it makes, as returned
+    by get_lookups, the names of the 'debug_tags' left in it and an 'error' if
+    it could not be read or parsed.
+    """
+    name, path = name_and_path
+    result = {
+        'name': name,
+        'path': path,
+        'lookups': [],
+        'debug_tags': [],
+        'error': None,
+    }
+    try:
+        with io.open(path, encoding=settings.FILE_CHARSET) as template_file:
+            source = template_file.read()
+        result['debug_tags'] = strip_debug_tags(source)[1]
+        result['lookups'] = get_lookups(compile_template(source, name))
+    except Exception as e:
+        result['error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+    return result
+
+
+def compile_template(source, name):
+    """
+    Given the source and name of a template, compile it with TEMPLATE_DEBUG
+    on, so its nodes know their line numbers
+    """
+    if Engine is None:
+        debug = settings.TEMPLATE_DEBUG
+        settings.TEMPLATE_DEBUG = True
+        try:
+            return Template(source, None, name)
+        finally:
+            settings.TEMPLATE_DEBUG = debug
+    engine = Engine.get_default()
+    debug = engine.debug
+    engine.debug = True
+    try:
+        return Template(source, None, name, engine)
+    finally:
+        engine.debug = debug
+
+
+def get_lookups(template):
+    """
+    Given a compiled template, return a list of dictionaries with each
+    variable 'lookup' chain it makes, such as 'order.customer.city', the
+    'line' it is on and its 'depth', the number of {% for %} loops it is
+    inside of, in the order they appear
+    """
+    lookups = []
+    line_numbers = LineNumbers()
+    stack = [(node, 0) for node in reversed(template.nodelist)]
+    while stack:
+        node, depth = stack.pop()
+        if not isinstance(node, Node):
+            continue
+        line = line_numbers.get(node)
+        for variable in _find_variables(node):
+            lookups.append({'lookup': variable, 'line': line, 'depth': depth})
+        if hasattr(node, 'conditions_nodelists'):
+            children = [(child, depth) for condition, child in
+                        node.conditions_nodelists]
+        else:
+            # Only the loop body of a {% for %} repeats
+            children = [(getattr(node, attr, None),
+                         depth + 1 if isinstance(node, ForNode) and
+                         attr == 'nodelist_loop' else depth)
+                        for attr in getattr(node, 'child_nodelists', ())]
+        for nodelist, child_depth in reversed(children):
+            if nodelist:
+                stack.extend((child, child_depth)
+                             for child in reversed(nodelist))
+    return lookups
+
+
+def _find_variables(node):
+    """
+    Given a node, generate the lookup chains of the variables it resolves
+    itself, leaving out those of its child nodes
+    """
+    stack = list(node.__dict__.values())
+    seen = set()
+    while stack:
+        value = stack.pop()
+        if id(value) in seen or isinstance(value, (Node, NodeList)):
+            continue
+        seen.add(id(value))
+        if isinstance(value, FilterExpression):
+            stack.append(value.var)
+            for func, args in value.filters:
+                stack.extend(arg for lookup, arg in args if lookup)
+        elif isinstance(value, Variable):
+            # Literals such as numbers and quoted strings have no lookups
+            if value.lookups is not None:
+                yield value.var
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif getattr(value.__class__, '__module__', '').startswith(
+                TEMPLATE_MODULES) and hasattr(value, '__dict__'):
+            stack.extend(value.__dict__.values())
+
+
+def _setup_worker():
+    """Load Django in processes that were spawned rather than forked"""
+    import django
+    # Django >= 1.7
+    if hasattr(django, 'setup'):
+        from django.apps import apps
+        if not apps.ready:
+            django.setup()
+
+
+class AnalysisCache(object):
+    """
+    The analyses of templates stored in a JSON file, keyed by path. An
+    analysis is only used while the template's mtime is unchanged.
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE):
+        self.path = path
+        self._entries = {}
+        try:
+            with open(path) as cache_file:
+                data = json.load(cache_file)
+        except (IOError, ValueError):
+            return
+        if data.get('version') == ANALYSIS_VERSION:
+            self._entries = data.get('entries', {})
+
+    def get(self, path, mtime):
+        entry = self._entries.get(path)
+        if entry is None or entry['mtime'] != mtime:
+            return None
+        return entry['result']
+
+    def set(self, path, mtime, result):
+        self._entries[path] = {'mtime': mtime, 'result': result}
+
+    def save(self, paths):
+        """Given the paths to keep, write them to the cache file"""
+        entries = dict((path, self._entries[path]) for path in paths
+                       if path in self._entries)
+        with open(self.path, 'w') as cache_file:
+            json.dump({'version': ANALYSIS_VERSION, 'entries': entries},
+                      cache_file)
+
+
+def analyze_templates(templates, processes=None, cache=None):
+    """
+    Given a list of (template name, path) tuples, return a list of their
+    analyses from analyze_template. Templates are parsed in `processes`
+    processes, which defaults to the number of CPUs. If an AnalysisCache is
+    given, only templates changed since they were cached are parsed.
+    """
+    results = {}
+    mtimes = {}
+    changed = []
+    for name, path in templates:
+        mtimes[path] = os.path.getmtime(path)
+        result = cache.get(path, mtimes[path]) if cache is not None else None
+        if result is not None and result['name'] == name:
+            results[path] = result
+        else:
+            changed.append((name, path))
+    if processes is None:
+        processes = cpu_count()
+    if processes > 1 and len(changed) > 1:
+        pool = Pool(min(processes, len(changed)), _setup_worker)
+        try:
+            analyses = pool.map(analyze_template, changed,
+                                chunksize=max(1, len(changed) //
+                                              (processes * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        analyses = [analyze_template(template) for template in changed]
+    for result in analyses:
+        results[result['path']] = result
+        if cache is not None:
+            cache.set(result['path'], mtimes[result['path']], result)
+    if cache is not None:
+        cache.save([path for name, path in templates])
+    return [results[path] for name, path in templates]
@@ -0,0 +1,158 @@
+"""
+Collection of the output of the debug tags per request, for viewing in the
+browser rather than on the terminal of one of many workers. Enable it with::
+
+    TEMPLATE_DEBUG_SINK = {
+        'BACKEND': 'template_debug.collector.CollectorSink',
+    }
+    MIDDLEWARE_CLASSES = (
+        ...
+        'template_debug.middleware.ProfilingMiddleware',
+        'template_debug.middleware.CollectorMiddleware',
+    )
+
+and include template_debug.urls in the URLconf. Records are kept as the tags
+emit them and only formatted when they are viewed.
+"""
+
+from __future__ import unicode_literals
+from itertools import count
+from threading import local
+from time import time
+
+from django.conf import settings
+
+from template_debug.sinks import BaseSink
+from template_debug.utils import LRUCache
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    # Python < 3.7
+    ContextVar = None
+
+
+# Default number of recent requests kept
+COLLECTOR_SIZE = 50
+
+
+class _ThreadLocalVar(object):
+    """The part of ContextVar used here, for Pythons without contextvars"""
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self._default = default
+        self._local = local()
+
+    def get(self):
+        return getattr(self._local, 'value', self._default)
+
+    def set(self, value):
+        self._local.value = value
+
+
+if ContextVar is not None:
+    _current = ContextVar('template_debug_request', default=None)
+else:
+    _current = _ThreadLocalVar('template_debug_request', default=None)
+
+_ids = count(1)
+
+
+class RequestRecords(object):
+    """
+    The records emitted while handling one request, along with its timing
+    and the database queries it ran
+    """
+
+    def __init__(self, path, method):
+        self.id = next(_ids)
+        self.path = path
+        self.method = method
+        self.time = time()
+        self.records = []
+        self.status_code = None
+        self.duration = None
+        self.query_count = None
+        self.query_time = None
+        self.timings = {}
+        self.processors = []
+        self.render_trees = []
+
+
+class RequestStore(object):
+    """The RequestRecords of the `size` most recent requests"""
+
+    def __init__(self, size=COLLECTOR_SIZE):
+        self._requests = LRUCache(size)
+
+    def add(self, request_records):
+        self._requests.set(request_records.id, request_records)
+
+    def get(self, request_id):
+        return self._requests.get(request_id)
+
+    def requests(self):
+        """Return a list of the RequestRecords, most recent first"""
+        return [request_records for request_id, request_records in
+                reversed(self._requests.items())]
+
+    def clear(self):
+        self._requests.clear()
+
+
+_store = None
+
+
+def get_store():
+    """
+    Return the RequestStore, holding as many requests as the
+    TEMPLATE_DEBUG_COLLECTOR_SIZE setting, creating it on first use
+    """
+    global _store
+    if _store is None:
+        _store = RequestStore(getattr(settings, 'TEMPLATE_DEBUG_COLLECTOR_SIZE',
+                                      COLLECTOR_SIZE))
+    return _store
+
+
+def start_request(path, method):
+    """
+    Given the path and method of a request that is starting, collect the
+    records emitted in the current context for it. Return its RequestRecords.
+    """
+    request_records = RequestRecords(path, method)
+    _current.set(request_records)
+    return request_records
+
+
+def finish_request(store=True):
+    """
+    Stop collecting for the request of the current context and, if `store` is
+    True, store its RequestRecords. Return them, or None if no request was
+    started.
+    """
+    request_records = _current.get()
+    _current.set(None)
+    if request_records is not None and store:
+        get_store().add(request_records)
+    return request_records
+
+
+def get_current():
+    """Return the RequestRecords of the current context, or None"""
+    return _current.get()
+
+
+class CollectorSink(BaseSink):
+    """
+    Adds each record to the RequestRecords of the current request. Records
+    emitted outside of a request started by CollectorMiddleware are dropped.
+    Adding a record is cheap, so the sink should not be BUFFERED, which would
+    also lose track of the request.
+    """
+
+    def emit(self, record):
+        request_records = _current.get()
+        if request_records is not None:
+            request_records.records.append(record)
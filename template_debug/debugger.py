@@ -0,0 +1,120 @@
+"""
+Checks for a PyDev debugger listening for the {% pydevd %} tag, without
+blocking renders when there is none.
+"""
+
+from __future__ import unicode_literals
+import socket
+from threading import Lock, Thread
+from time import time
+
+from django.conf import settings
+
+
+# Defaults for the settings of the debugger the pydevd tag connects to.
+# The host and port are the defaults of pydevd.settrace.
+PYDEVD_HOST = 'localhost'
+PYDEVD_PORT = 5678
+
+# Seconds a render waits for a probe of the debugger to connect
+PYDEVD_TIMEOUT = 0.1
+
+# Seconds before a debugger found unavailable is probed again
+PYDEVD_RETRY_AFTER = 30
+
+
+class DebuggerProbe(object):
+    """
+    Tells whether a debugger is listening at `host` and `port`. The port is
+    probed from a background thread, and callers wait for the result at most
+    `timeout` seconds. A slower probe finishes in the background and its
+    result is used by later calls. A failure is remembered for
+    `retry_after` seconds, during which the debugger is reported unavailable
+    without probing it again.
+    """
+
+    def __init__(self, host=PYDEVD_HOST, port=PYDEVD_PORT,
+                 timeout=PYDEVD_TIMEOUT, retry_after=PYDEVD_RETRY_AFTER,
+                 clock=time, connect=socket.create_connection):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.available = None
+        self.checked = None
+        self._clock = clock
+        self._connect = connect
+        self._probe = None
+        self._lock = Lock()
+
+    def is_available(self):
+        """
+        Return True if the debugger was found listening. Start a probe if its
+        availability is unknown or the last failure has expired.
+        """
+        with self._lock:
+            if self.available:
+                return True
+            if self.available is False and \
+                    self._clock() - self.checked < self.retry_after:
+                return False
+            probe = self._probe
+            if probe is None:
+                probe = self._probe = Thread(target=self._run,
+                                             name='template_debug pydevd')
+                probe.daemon = True
+                probe.start()
+        probe.join(self.timeout)
+        return bool(self.available)
+
+    def mark_failed(self):
+        """Report the debugger unavailable until `retry_after` has passed"""
+        with self._lock:
+            self.available = False
+            self.checked = self._clock()
+
+    def _run(self):
+        try:
+            self._connect((self.host, self.port), self.timeout).close()
+        except socket.error:
+            available = False
+        else:
+            available = True
+        with self._lock:
+            self.available = available
+            self.checked = self._clock()
+            self._probe = None
+
+
+_probe = None
+_probe_lock = Lock()
+
+
+def get_probe():
+    """
+    Return the DebuggerProbe configured by the TEMPLATE_DEBUG_PYDEVD_HOST,
+    TEMPLATE_DEBUG_PYDEVD_PORT, TEMPLATE_DEBUG_PYDEVD_TIMEOUT and
+    TEMPLATE_DEBUG_PYDEVD_RETRY_AFTER settings, creating it on first use
+    """
+    global _probe
+    if _probe is None:
+        with _probe_lock:
+            if _probe is None:
+                _probe = DebuggerProbe(
+                    getattr(settings, 'TEMPLATE_DEBUG_PYDEVD_HOST',
+                            PYDEVD_HOST),
+                    getattr(settings, 'TEMPLATE_DEBUG_PYDEVD_PORT',
+                            PYDEVD_PORT),
+                    getattr(settings, 'TEMPLATE_DEBUG_PYDEVD_TIMEOUT',
+                            PYDEVD_TIMEOUT),
+                    getattr(settings, 'TEMPLATE_DEBUG_PYDEVD_RETRY_AFTER',
+                            PYDEVD_RETRY_AFTER),
+                )
+    return _probe
+
+
+def reset_probe():
+    """Forget the current probe, so it is created again from the settings"""
+    global _probe
+    with _probe_lock:
+        _probe = None
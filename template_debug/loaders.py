@@ -0,0 +1,438 @@
+"""
+Template loaders that wrap the configured loaders to add debugging features
+without editing templates. For example::
+
+    TEMPLATE_LOADERS = (
+        ('template_debug.loaders.ProfilingLoader', (
+            ('django.template.loaders.cached.Loader', (
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            )),
+        )),
+    )
+"""
+
+from __future__ import unicode_literals
+from bisect import bisect_right
+import logging
+
+from django.template.base import (BLOCK_TAG_END, BLOCK_TAG_START, Node,
+    TemplateDoesNotExist, tag_re)
+from django.template.loader_tags import BlockNode, ExtendsNode, IncludeNode
+try:
+    from django.template.loaders.base import Loader as BaseLoader
+except ImportError:
+    # Django < 1.8
+    from django.template.loader import BaseLoader, find_template_loader
+from django.utils.encoding import force_text
+
+from template_debug import render_tree
+from template_debug.profiling import (is_enabled, is_recording, node_stats,
+    record, timer_ns)
+
+
+DEBUG_LIBRARY = 'debug_tags'
+
+# Names of the templates that StrippingLoader removed debug tags from, mapped
+# to the names of the tags removed
+stripped_templates = {}
+
+
+class WrappingLoader(BaseLoader):
+    """
+    Base class for loaders that load templates from the given loaders, in
+    order, and pass each compiled template to process_template.
+    """
+    is_usable = True
+
+    def __init__(self, *args):
+        # Django >= 1.8 passes the template engine before the loaders
+        if getattr(BaseLoader, '_accepts_engine_in_init', False):
+            engine, self._loaders = args
+            super(WrappingLoader, self).__init__(engine)
+        else:
+            self._loaders, = args
+        self._cached_loaders = []
+
+    @property
+    def loaders(self):
+        # Resolve loaders on demand to avoid circular imports
+        if not self._cached_loaders:
+            if hasattr(self, 'engine'):
+                loaders = self.engine.get_template_loaders(self._loaders)
+            else:
+                loaders = [find_template_loader(loader)
+                           for loader in self._loaders]
+            self._cached_loaders = loaders
+        return self._cached_loaders
+
+    def load_template(self, template_name, template_dirs=None):
+        for loader in self.loaders:
+            try:
+                template, display_name = loader(template_name, template_dirs)
+            except TemplateDoesNotExist:
+                continue
+            if hasattr(template, 'render'):
+                self.process_template(template, template_name)
+            return template, display_name
+        raise TemplateDoesNotExist(template_name)
+
+    def process_template(self, template, template_name):
+        """Given a compiled template and its name, modify it in place"""
+        raise NotImplementedError('subclasses of WrappingLoader must provide '
+                                  'a process_template() method')
+
+    def reset(self):
+        for loader in self.loaders:
+            loader.reset()
+
+
+class ProfilingLoader(WrappingLoader):
+    """
+    Times the rendering of every node of the templates it loads, recording
+    the durations in template_debug.profiling.node_stats keyed by template
+    name, line number and node class. Nodes whose line is unknown, or that
+    share their line with another node of the same class, are told apart by
+    their index in the template, as in 'home.html:#4 IfNode'.
+
+    Templates are only instrumented when the TEMPLATE_DEBUG_PROFILE setting,
+    which defaults to TEMPLATE_DEBUG, is True at the time they are loaded.
+    Otherwise they are returned untouched and render at no extra cost. With
+    ProfilingMiddleware installed, only sampled requests are recorded.
+    """
+
+    def process_template(self, template, template_name):
+        # Cached loaders return the same template each time
+        if not is_enabled() or \
+                getattr(template, '_template_debug_profiled', False):
+            return
+        template._template_debug_profiled = True
+        line_numbers = LineNumbers()
+        keys = set()
+        for index, node in enumerate(iter_nodes(template.nodelist)):
+            line = line_numbers.get(node)
+            key = '{0}:{1} {2}'.format(template_name, line,
+                                       node.__class__.__name__)
+            # A key shared by nested nodes would count their time twice
+            if line == '?' or key in keys:
+                key = '{0}:#{1} {2}'.format(template_name, index,
+                                            node.__class__.__name__)
+            keys.add(key)
+            _instrument_node(node, key)
+
+
+class RenderTreeLoader(WrappingLoader):
+    """
+    Records the templates and blocks rendered by each top level render as a
+    tree, with the inclusive and exclusive time of each node and the time
+    taken to load each template. Wrap Django's cached loader with it to see
+    whether templates are found in the cache or compiled again::
+
+        TEMPLATE_LOADERS = (
+            ('template_debug.loaders.RenderTreeLoader', (
+                ('django.template.loaders.cached.Loader', (
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                )),
+            )),
+        )
+
+    Finished trees are kept in template_debug.render_tree.recent_trees and in
+    the records of the current request collected by CollectorMiddleware. As
+    with ProfilingLoader, templates are only instrumented when profiling is
+    enabled at the time they are loaded, and only sampled requests are
+    recorded.
+    """
+
+    def load_template(self, template_name, template_dirs=None):
+        start = timer_ns()
+        for loader in self.loaders:
+            try:
+                template, display_name = loader(template_name, template_dirs)
+            except TemplateDoesNotExist:
+                continue
+            duration = timer_ns() - start
+            if hasattr(template, 'render') and is_enabled():
+                # A cached loader returns the template instrumented before
+                cached = getattr(template, '_template_debug_tree', False)
+                self.process_template(template, template_name)
+                if is_recording():
+                    render_tree.record_load(template, duration, cached)
+            return template, display_name
+        raise TemplateDoesNotExist(template_name)
+
+    def process_template(self, template, template_name):
+        if getattr(template, '_template_debug_tree', False):
+            return
+        template._template_debug_tree = True
+        _instrument_template(template, template_name)
+        for node in iter_nodes(template.nodelist):
+            if isinstance(node, BlockNode):
+                _instrument_block(node)
+            elif isinstance(node, ExtendsNode):
+                _instrument_loading_node(node, 'extends')
+            elif isinstance(node, IncludeNode):
+                _instrument_loading_node(node, 'include')
+
+
+class StrippingLoader(WrappingLoader):
+    """
+    Removes {% load debug_tags %} and the debug tags from the source of the
+    templates it loads before they are compiled, so no debug node is ever
+    cached or rendered. Block tags such as {% profile %} are replaced by their
+    contents. Meant for production, wrapping loaders that return sources::
+
+        TEMPLATE_LOADERS = (
+            ('django.template.loaders.cached.Loader', (
+                ('template_debug.loaders.StrippingLoader', (
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                )),
+            )),
+        )
+
+    Each template that had tags removed is logged as a warning to the
+    'template_debug' logger and recorded in stripped_templates.
+    """
+
+    def load_template(self, template_name, template_dirs=None):
+        # Compile the stripped source, as loaders that return sources do
+        return BaseLoader.load_template(self, template_name, template_dirs)
+
+    def load_template_source(self, template_name, template_dirs=None):
+        for loader in self.loaders:
+            try:
+                source, display_name = loader.load_template_source(
+                    template_name, template_dirs)
+            except TemplateDoesNotExist:
+                continue
+            source, tags = strip_debug_tags(source)
+            if tags:
+                stripped_templates[template_name] = tags
+                logging.getLogger('template_debug').warning(
+                    'Removed debug tags from %s: %s', template_name,
+                    ', '.join(tags))
+            return source, display_name
+        raise TemplateDoesNotExist(template_name)
+
+
+def strip_debug_tags(source):
+    """
+    Given the source of a template, return it without {% load debug_tags %}
+    and the debug tags it loads, along with a list of the names of the tags
+    removed. Line numbers are left unchanged.
+    """
+    from template_debug.templatetags.debug_tags import register
+    debug_tags = set(register.tags)
+    # Block tags end with e.g. {% endprofile %}
+    debug_tags.update(['end' + name for name in register.tags])
+    loaded = set()
+    removed = []
+    bits = []
+    position = 0
+    verbatim = None
+    for match in tag_re.finditer(source):
+        token = match.group(0)
+        if not token.startswith(BLOCK_TAG_START):
+            continue
+        args = token[len(BLOCK_TAG_START):-len(BLOCK_TAG_END)].split()
+        if not args:
+            continue
+        # Tags inside of {% verbatim %} are text
+        if verbatim is not None:
+            if args == verbatim:
+                verbatim = None
+            continue
+        if args[0] == 'verbatim':
+            verbatim = ['endverbatim'] + args[1:]
+            continue
+        if args[0] == 'load':
+            replacement, names = _strip_load(args, debug_tags)
+            if not names:
+                continue
+            loaded.update(names)
+        elif args[0] in loaded:
+            replacement = ''
+        else:
+            continue
+        bits.extend([source[position:match.start()], replacement])
+        position = match.end()
+        removed.append(args[0])
+    if not removed:
+        return source, removed
+    bits.append(source[position:])
+    return ''.join(bits), removed
+
+
+def _strip_load(args, debug_tags):
+    """
+    Given the arguments of a {% load %} tag and the names of the debug tags,
+    return the tag without the debug library, or '' if nothing is left, and
+    the names of the debug tags it loaded
+    """
+    # {% load variables details from debug_tags %}
+    if len(args) > 3 and args[-2] == 'from':
+        if args[-1] != DEBUG_LIBRARY:
+            return None, set()
+        names = set(args[1:-2])
+        names.update(['end' + name for name in names])
+        return '', names & debug_tags
+    if DEBUG_LIBRARY not in args[1:]:
+        return None, set()
+    libraries = [name for name in args[1:] if name != DEBUG_LIBRARY]
+    if not libraries:
+        return '', debug_tags
+    return '{0} load {1} {2}'.format(BLOCK_TAG_START, ' '.join(libraries),
+                                     BLOCK_TAG_END), debug_tags
+
+
+def iter_nodes(nodelist):
+    """
+    Given a nodelist, generate each of its nodes and their descendants,
+    depth first, without recursion
+    """
+    stack = list(reversed(nodelist))
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Node):
+            continue
+        yield node
+        # IfNode keeps its nodelists alongside their conditions
+        if hasattr(node, 'conditions_nodelists'):
+            children = [child for condition, child in
+                        node.conditions_nodelists]
+        else:
+            children = [getattr(node, attr, None)
+                        for attr in getattr(node, 'child_nodelists', ())]
+        for child in reversed(children):
+            if child:
+                stack.extend(reversed(child))
+
+
+class LineNumbers(object):
+    """
+    Finds the line number of nodes in their template. Nodes only carry their
+    position when the template was compiled with TEMPLATE_DEBUG on.
+    """
+
+    def __init__(self):
+        self._newlines = {}
+
+    def get(self, node):
+        """Given a node, return its line number or '?' if it is unknown"""
+        # Django >= 1.9 records the line number of each token
+        lineno = getattr(getattr(node, 'token', None), 'lineno', None)
+        if lineno is not None:
+            return lineno
+        try:
+            origin, (start, end) = node.source
+        except (AttributeError, TypeError, ValueError):
+            return '?'
+        newlines = self._get_newlines(origin)
+        if newlines is None:
+            return '?'
+        return bisect_right(newlines, start) + 1
+
+    def _get_newlines(self, origin):
+        """
+        Given an origin, return the sorted offsets of the newlines in its
+        source, reading the source only once
+        """
+        key = id(origin)
+        if key not in self._newlines:
+            try:
+                source = origin.reload()
+            except Exception:
+                source = None
+            self._newlines[key] = None if source is None else [
+                index for index, char in enumerate(source) if char == '\n']
+        return self._newlines[key]
+
+
+def get_template_name(node):
+    """
+    Given a node, return the name of the template it was compiled from, or
+    '?' if it is unknown
+    """
+    # Django >= 1.9 keeps the origin on the node, older versions in its source
+    origin = getattr(node, 'origin', None) or \
+        (getattr(node, 'source', None) or (None, ))[0]
+    for attr in ('template_name', 'loadname', 'name'):
+        name = getattr(origin, attr, None)
+        if name:
+            return force_text(name)
+    return '?'
+
+
+def _instrument_node(node, key):
+    """
+    Given a node and a key, make the node record the time taken by each of its
+    renders in node_stats under the key
+    """
+    render = node.render
+
+    def timed_render(context):
+        if not is_recording():
+            return render(context)
+        start = timer_ns()
+        try:
+            return render(context)
+        finally:
+            record(node_stats, key, timer_ns() - start)
+    node.render = timed_render
+
+
+def _instrument_template(template, template_name):
+    """
+    Given a template and its name, make each of its renders a node of the
+    render tree of the current thread
+    """
+    # Template.render and {% extends %} both render through _render
+    _render = template._render
+
+    def tree_render(context):
+        if not is_recording():
+            return _render(context)
+        node = render_tree.start_node(template_name, template)
+        start = timer_ns()
+        try:
+            return _render(context)
+        finally:
+            render_tree.finish_node(node, timer_ns() - start)
+    template._render = tree_render
+
+
+def _instrument_block(block):
+    """
+    Given a BlockNode, make each of its renders a node of the render tree of
+    the current thread. The parent template renders the block, even when a
+    child template overrides its contents.
+    """
+    render = block.render
+
+    def tree_render(context):
+        if not is_recording():
+            return render(context)
+        node = render_tree.start_node(block.name)
+        start = timer_ns()
+        try:
+            return render(context)
+        finally:
+            render_tree.finish_node(node, timer_ns() - start)
+    block.render = tree_render
+
+
+def _instrument_loading_node(loading_node, kind):
+    """
+    Given an {% extends %} or {% include %} node and its kind, make the
+    template it renders a node of that kind in the render tree
+    """
+    render = loading_node.render
+
+    def tree_render(context):
+        previous = render_tree.set_kind(kind)
+        try:
+            return render(context)
+        finally:
+            render_tree.set_kind(previous)
+    loading_node.render = tree_render
@@ -0,0 +1,88 @@
+"""
+Parse every template found through the configured loaders, without
+rendering, and report the deepest variable lookups and leftover debug tags.
+"""
+
+from __future__ import unicode_literals
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from template_debug.analysis import (ANALYSIS_CACHE, AnalysisCache,
+    analyze_templates, find_templates)
+
+
+OPTIONS = (
+    ('--processes', {'type': int, 'default': None,
+                     'help': 'number of processes that parse templates, '
+                             'defaults to the number of CPUs'}),
+    ('--cache', {'default': ANALYSIS_CACHE,
+                 'help': 'file of analyses reused while templates are '
+                         'unchanged'}),
+    ('--no-cache', {'action': 'store_false', 'dest': 'use_cache',
+                    'default': True,
+                    'help': 'parse every template again'}),
+    ('--limit', {'type': int, 'default': 20,
+                 'help': 'number of lookups to report'}),
+    ('--json', {'action': 'store_true', 'default': False,
+                'help': 'print the whole index as JSON'}),
+)
+
+
+class Command(BaseCommand):
+    help = ('Parse every template without rendering it and report the '
+            'variable lookups nested deepest in loops and leftover debug tags.')
+
+    # Django < 1.8 only supports optparse
+    if hasattr(BaseCommand, 'option_list'):
+        option_list = BaseCommand.option_list + tuple(
+            make_option(flag, **kwargs) for flag, kwargs in OPTIONS)
+
+    def add_arguments(self, parser):
+        for flag, kwargs in OPTIONS:
+            parser.add_argument(flag, **kwargs)
+
+    def handle(self, *args, **options):
+        cache = AnalysisCache(options['cache']) if options['use_cache'] \
+            else None
+        index = analyze_templates(find_templates(), options['processes'],
+                                  cache)
+        if options['json']:
+            self.stdout.write(json.dumps(index, indent=2))
+            return
+        for lines in (self._format_errors(index),
+                      self._format_debug_tags(index),
+                      self._format_lookups(index, options['limit'])):
+            for line in lines:
+                self.stdout.write(line)
+
+    def _format_errors(self, index):
+        errors = [result for result in index if result['error']]
+        if errors:
+            yield 'Templates that could not be parsed:'
+            for result in errors:
+                yield '  {0}: {1}'.format(result['name'], result['error'])
+
+    def _format_debug_tags(self, index):
+        leftovers = [result for result in index if result['debug_tags']]
+        if leftovers:
+            yield 'Templates with debug tags:'
+            for result in leftovers:
+                yield '  {0}: {1}'.format(result['name'],
+                                          ', '.join(result['debug_tags']))
+
+    def _format_lookups(self, index, limit):
+        """
+        Yield a line for each of the `limit` lookups that are nested in the
+        most loops, with longer lookup chains first
+        """
+        lookups = [(lookup['depth'], lookup['lookup'].count('.'),
+                    result['name'], lookup['line'], lookup['lookup'])
+                   for result in index for lookup in result['lookups']]
+        lookups.sort(key=lambda row: (-row[0], -row[1], row[2], str(row[3])))
+        yield '{0} templates, {1} lookups. Deepest lookups:'.format(
+            len(index), len(lookups))
+        for depth, dots, name, line, lookup in lookups[:limit]:
+            yield '  depth {0}  {1}  {2}:{3}'.format(depth, lookup, name,
+                                                      line)
@@ -0,0 +1,108 @@
+"""
+Open a snapshot written by the {% snapshot %} tag in an interactive shell.
+"""
+
+from __future__ import unicode_literals
+import code
+from datetime import datetime
+from optparse import make_option
+from pprint import pformat
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+from django import template
+from django.core.management.base import BaseCommand, CommandError
+
+from template_debug.snapshots import (SNAPSHOT_VERSION, get_snapshot_values,
+    read_snapshot)
+from template_debug.utils import format_variable_index
+
+
+OPTIONS = (
+    ('--no-shell', {'action': 'store_false', 'dest': 'shell',
+                    'default': True,
+                    'help': 'print the snapshot without starting a shell'}),
+)
+
+
+class Command(BaseCommand):
+    help = ('Open a snapshot written by the {% snapshot %} tag in an '
+            'interactive shell with its variables available.')
+    args = '<path>'
+
+    # Django < 1.8 only supports optparse
+    if hasattr(BaseCommand, 'option_list'):
+        option_list = BaseCommand.option_list + tuple(
+            make_option(flag, **kwargs) for flag, kwargs in OPTIONS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        for flag, kwargs in OPTIONS:
+            parser.add_argument(flag, **kwargs)
+
+    def handle(self, *args, **options):
+        path = options.get('path') or (args[0] if args else None)
+        if not path:
+            raise CommandError('Give the path of a snapshot file.')
+        try:
+            snapshot = read_snapshot(path)
+        except (IOError, ValueError) as e:
+            raise CommandError('Unable to read {0}: {1}'.format(path, e))
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise CommandError('{0} was written by another version of '
+                               'template_debug.'.format(path))
+        namespace = self.get_namespace(snapshot)
+        banner = '\n'.join(self.get_banner(snapshot, namespace['availables']))
+        if not options['shell']:
+            self.stdout.write(banner)
+            return
+        code.interact(banner, local=namespace)
+
+    def get_banner(self, snapshot, availables):
+        yield 'Snapshot of {0}, line {1}, taken {2}'.format(
+            snapshot['template'], snapshot['line'],
+            datetime.fromtimestamp(snapshot['time']).strftime(
+                '%Y-%m-%d %H:%M:%S'))
+        yield 'Variables that were available in the context:'
+        yield pformat(availables)
+        yield 'Type `availables` to show this list.'
+        yield ('Type `layers()` to show the context layer that provided each '
+               'variable.')
+        yield ('Type <variable_name> to show the repr of one, and '
+               '`details("<variable_name>")` to show its attributes.')
+        yield ('Use render("template string") to test template rendering '
+               'against the attributes that were captured.')
+
+    def get_namespace(self, snapshot):
+        """
+        Given a snapshot, return the local scope of the shell: its variables
+        and the availables, layers, details and render helpers
+        """
+        index = OrderedDict(sorted(snapshot['index'].items()))
+        values = get_snapshot_values(snapshot)
+        namespace = dict(values)
+
+        def layers():
+            for line in format_variable_index(index):
+                print(line)
+
+        def details(name):
+            variable = snapshot['variables'][name]
+            var_data = dict(('META_' + key, value)
+                            for key, value in variable['meta'].items())
+            var_data.update(variable['attributes'])
+            print(pformat(var_data))
+
+        namespace.update({
+            'snapshot': snapshot,
+            'availables': list(index),
+            'layers': layers,
+            'details': details,
+            'render': lambda s: template.Template(s).render(
+                template.Context(values)),
+        })
+        return namespace
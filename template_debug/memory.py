@@ -0,0 +1,93 @@
+"""
+Deep memory sizes of the variables in a template context.
+"""
+
+from __future__ import unicode_literals
+import gc
+import sys
+from collections import deque
+from itertools import islice
+from types import (BuiltinFunctionType, CodeType, FrameType, FunctionType,
+    ModuleType)
+
+try:
+    from types import ClassType
+except ImportError:
+    # Python 3 has no old style classes
+    ClassType = type
+
+from template_debug.utils import get_variable_index, iteritems
+
+
+# Maximum number of objects visited to size one variable
+MEMORY_OBJECT_BUDGET = 100000
+
+# Objects that are shared by the whole process rather than kept alive by a
+# render, such as classes and the module globals reachable from functions
+SHARED_TYPES = (type, ClassType, ModuleType, FunctionType, BuiltinFunctionType,
+                CodeType, FrameType)
+
+# Containers whose items can be counted without listing them all
+CONTAINER_TYPES = (list, tuple, dict, set, frozenset, deque)
+
+
+def deep_size(obj, budget=MEMORY_OBJECT_BUDGET):
+    """
+    Given an object, return a tuple of the total size in bytes of it and the
+    objects it references, the number of objects counted, and False if the
+    `budget` of objects ran out before all of them were counted, else True.
+    Each object is counted once, so reference cycles are safe.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    complete = True
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        if len(seen) >= budget:
+            complete = False
+            break
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        remaining = budget - len(seen)
+        if isinstance(obj, CONTAINER_TYPES) and len(obj) > remaining:
+            # Large containers are not listed beyond what the budget can
+            # count, as gc.get_referents would list every item
+            complete = False
+            if isinstance(obj, dict):
+                for item in islice(iteritems(obj), remaining):
+                    stack.extend(item)
+            else:
+                stack.extend(islice(obj, remaining))
+            continue
+        stack.extend(gc.get_referents(obj))
+        # The referents of many objects together may still be too many
+        if len(stack) > budget:
+            del stack[:len(stack) - budget]
+            complete = False
+    return size, len(seen), complete
+
+
+def get_context_memory(context, budget=MEMORY_OBJECT_BUDGET):
+    """
+    Given a context, return a list of dictionaries with the 'name' of each
+    variable, the 'layer' that provides it, its deep 'size' in bytes, the
+    number of 'objects' counted and whether the count is 'complete', with the
+    largest size first. Objects shared by variables count towards each. The
+    builtins, such as True and None, are left out.
+    """
+    rows = []
+    for name, layers in get_variable_index(context).items():
+        if layers[0] == 0:
+            continue
+        size, objects, complete = deep_size(context[name], budget)
+        rows.append({
+            'name': name,
+            'layer': layers[0],
+            'size': size,
+            'objects': objects,
+            'complete': complete,
+        })
+    return sorted(rows, key=lambda row: row['size'], reverse=True)
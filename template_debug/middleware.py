@@ -0,0 +1,76 @@
+"""
+Middleware for profiling template rendering and collecting debug output.
+"""
+
+from __future__ import unicode_literals
+from timeit import default_timer
+
+from django.conf import settings
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    # Django < 1.10
+    MiddlewareMixin = object
+
+from template_debug import collector
+from template_debug.profiling import (is_enabled, start_request,
+    finish_request, get_sample)
+from template_debug.processors import instrument_processors
+from template_debug.queries import QueryCounter
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Samples requests for template profiling so it can be left on under load.
+    See template_debug.profiling.Sampler for the settings that control it.
+    When profiling is enabled, the configured context processors are timed
+    as well.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ProfilingMiddleware, self).__init__(*args, **kwargs)
+        if is_enabled():
+            instrument_processors()
+
+    def process_request(self, request):
+        if is_enabled():
+            start_request(request.path)
+
+    def process_response(self, request, response):
+        finish_request()
+        return response
+
+
+class CollectorMiddleware(MiddlewareMixin):
+    """
+    Collects the output of the debug tags for each request, along with its
+    duration, the queries it ran and its profiling timings, for viewing with
+    template_debug.views. List it after ProfilingMiddleware.
+    """
+
+    def process_request(self, request):
+        if not getattr(settings, 'TEMPLATE_DEBUG', False):
+            return
+        collector.start_request(request.path, request.method)
+        request._template_debug_counter = QueryCounter().__enter__()
+        request._template_debug_start = default_timer()
+
+    def process_response(self, request, response):
+        counter = getattr(request, '_template_debug_counter', None)
+        if counter is None:
+            return response
+        counter.__exit__(None, None, None)
+        del request._template_debug_counter
+        request_records = collector.finish_request(
+            store=not getattr(request, 'template_debug_ignore', False))
+        if request_records is not None:
+            request_records.status_code = response.status_code
+            request_records.duration = \
+                default_timer() - request._template_debug_start
+            request_records.query_count = counter.count
+            request_records.query_time = counter.time
+            sample = get_sample()
+            if sample is not None:
+                request_records.timings = sample.timings
+        return response
@@ -0,0 +1,189 @@
+"""
+Detection of queries that are repeated on each iteration of a template loop.
+"""
+
+from __future__ import unicode_literals
+import re
+from threading import Lock, local
+
+from django.template.base import Template
+from django.template.defaulttags import ForNode
+from django.template.loader_tags import BLOCK_CONTEXT_KEY
+
+from template_debug.loaders import LineNumbers, get_template_name, iter_nodes
+from template_debug.queries import QueryCounter
+
+
+# Lists of placeholders, e.g. from __in lookups, vary in length between queries
+IN_PLACEHOLDERS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+_state = local()
+_track_lock = Lock()
+
+
+def track_nodes(nodelist):
+    """
+    Given a nodelist, make each of its nodes and their descendants keep track
+    of being rendered while a LoopQueryDetector is active on the thread
+    """
+    with _track_lock:
+        for node in iter_nodes(nodelist):
+            if not node.__dict__.get('_nplusone_tracked', False):
+                _track_node(node)
+
+
+def track_block_overrides(context):
+    """
+    Given a context, track the nodes of the {% block %}s overriding those of
+    the template being rendered, which are defined in templates extending it
+    """
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    if block_context is None:
+        return
+    for blocks in block_context.blocks.values():
+        track_nodes(blocks)
+
+
+def _track_node(node):
+    render = node.render
+
+    def tracked_render(context):
+        stack = getattr(_state, 'node_stack', None)
+        if stack is None:
+            return render(context)
+        stack.append(node)
+        try:
+            return render(context)
+        finally:
+            stack.pop()
+    node.render = tracked_render
+    node._nplusone_tracked = True
+
+
+_template_lock = Lock()
+_template_users = 0
+_original_template_render = []
+
+
+def _patch_template_render():
+    """
+    Make each Template track its nodes when rendered while a
+    LoopQueryDetector is active on the thread, so templates that are
+    included or extended are tracked too. Calls are reference counted.
+    """
+    global _template_users
+    with _template_lock:
+        _template_users += 1
+        if _template_users > 1:
+            return
+        # ExtendsNode renders its parent with _render rather than render
+        render = Template.__dict__['_render']
+        _original_template_render.append(render)
+
+        def tracked_render(self, context):
+            if getattr(_state, 'node_stack', None) is not None and \
+                    not self.__dict__.get('_nplusone_tracked', False):
+                track_nodes(self.nodelist)
+                self._nplusone_tracked = True
+            return render(self, context)
+        Template._render = tracked_render
+
+
+def _unpatch_template_render():
+    global _template_users
+    with _template_lock:
+        _template_users -= 1
+        if _template_users:
+            return
+        Template._render = _original_template_render.pop()
+
+
+def get_query_shape(sql):
+    """
+    Given SQL with placeholders, return it with whitespace collapsed and lists
+    of placeholders shortened, so similar queries have the same shape
+    """
+    return IN_PLACEHOLDERS.sub('(...)', WHITESPACE.sub(' ', sql).strip())
+
+
+class LoopQueryDetector(QueryCounter):
+    """
+    Counts the queries run while rendering nodes passed to track_nodes, or
+    nodes of templates rendered while it is active, grouped by the enclosing
+    {% for %} loop, the node that ran them and the shape of the query. A shape
+    that runs many times in the same loop usually means a missing
+    select_related or prefetch_related.
+    """
+
+    def __init__(self):
+        super(LoopQueryDetector, self).__init__()
+        self.locations = {}
+        self._line_numbers = LineNumbers()
+        self._owns_stack = False
+
+    def __call__(self, execute, sql, params, many, context):
+        try:
+            return super(LoopQueryDetector, self).__call__(
+                execute, sql, params, many, context)
+        finally:
+            self._add_location(sql)
+
+    def _add_location(self, sql):
+        stack = getattr(_state, 'node_stack', None) or [None]
+        node = stack[-1]
+        # A loop's own sequence is resolved once per render of the loop, so it
+        # counts towards the loop enclosing it
+        loop = None
+        for parent in reversed(stack[:-1]):
+            if isinstance(parent, ForNode):
+                loop = parent
+                break
+        key = (loop, node, get_query_shape(sql))
+        self.locations[key] = self.locations.get(key, 0) + 1
+
+    def __enter__(self):
+        if getattr(_state, 'node_stack', None) is None:
+            _patch_template_render()
+            _state.node_stack = []
+            self._owns_stack = True
+        return super(LoopQueryDetector, self).__enter__()
+
+    def __exit__(self, *exc_info):
+        super(LoopQueryDetector, self).__exit__(*exc_info)
+        if self._owns_stack:
+            _state.node_stack = None
+            self._owns_stack = False
+            _unpatch_template_render()
+
+    def describe(self, node):
+        """
+        Given a node, return a description of the form
+        '<template name>:<line number> <node class>'
+        """
+        if node is None:
+            return None
+        return '{0}:{1} {2}'.format(get_template_name(node),
+                                    self._line_numbers.get(node),
+                                    node.__class__.__name__)
+
+    def report(self):
+        """
+        Return a list of dictionaries with the 'loop' and 'node' that ran each
+        query shape, the 'sql' and the 'count', with the largest count first
+        """
+        rows = [{
+            'loop': self.describe(loop),
+            'node': self.describe(node),
+            'sql': sql,
+            'count': count,
+        } for (loop, node, sql), count in self.locations.items()]
+        return sorted(rows, key=lambda row: row['count'], reverse=True)
+
+    def repeated(self):
+        """
+        Return the rows of the report for query shapes that ran more than
+        once inside of the same loop
+        """
+        return [row for row in self.report()
+                if row['loop'] is not None and row['count'] > 1]
@@ -0,0 +1,144 @@
+"""
+Timing of the configured context processors, which run each time a
+RequestContext is built.
+"""
+
+from __future__ import unicode_literals
+from threading import Lock
+
+try:
+    from django.template.engine import Engine
+except ImportError:
+    # Django < 1.8
+    Engine = None
+
+from template_debug import collector
+from template_debug.profiling import Stat, is_recording, timer_ns
+from template_debug.queries import QueryCounter
+
+
+class ProcessorStats(object):
+    """
+    Thread safe durations, in nanoseconds, query counts and contributed
+    variable names of each context processor, aggregated across requests
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = Lock()
+
+    def add(self, name, duration, queries, query_time, variables):
+        with self._lock:
+            try:
+                stats = self._stats[name]
+            except KeyError:
+                stats = self._stats[name] = {
+                    'stat': Stat(),
+                    'queries': 0,
+                    'query_time': 0.0,
+                    'variables': set(),
+                }
+            stats['stat'].add(duration)
+            stats['queries'] += queries
+            stats['query_time'] += query_time
+            stats['variables'].update(variables)
+
+    def report(self):
+        """
+        Return a list of dictionaries with the 'name' of each processor, its
+        duration statistics as returned by Stat.as_dict, the total number of
+        'queries' it ran, their 'query_time' and the sorted names of the
+        'variables' it contributed, with the largest total duration first
+        """
+        with self._lock:
+            rows = []
+            for name, stats in self._stats.items():
+                row = stats['stat'].as_dict()
+                row.update({
+                    'name': name,
+                    'queries': stats['queries'],
+                    'query_time': stats['query_time'],
+                    'variables': sorted(stats['variables']),
+                })
+                rows.append(row)
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Timings recorded by the processors instrumented by instrument_processors
+processor_stats = ProcessorStats()
+
+# Name of the instrumented processor that last provided each variable
+_variable_processors = {}
+
+
+def get_variable_processor(name):
+    """
+    Given the name of a variable, return the name of the instrumented context
+    processor that last provided it, or None if none did
+    """
+    return _variable_processors.get(name)
+
+
+def instrument_processors():
+    """
+    Make each configured context processor record its duration, the queries
+    it runs and the variables it contributes in processor_stats, and in the
+    collected records of the current request. Only requests that are sampled
+    for profiling are recorded. Processors are only instrumented once.
+    """
+    if Engine is not None:
+        engine = Engine.get_default()
+        # template_context_processors is computed once and cached
+        engine.__dict__['template_context_processors'] = tuple(
+            _instrument_processor(processor)
+            for processor in engine.template_context_processors)
+    else:
+        from django.template import context
+        context._standard_context_processors = tuple(
+            _instrument_processor(processor)
+            for processor in context.get_standard_processors())
+
+
+def _instrument_processor(processor):
+    """Given a context processor, return it wrapped to record its cost"""
+    if getattr(processor, '_template_debug_instrumented', False):
+        return processor
+    name = '{0}.{1}'.format(getattr(processor, '__module__', '?'),
+                            getattr(processor, '__name__', repr(processor)))
+
+    def instrumented_processor(request):
+        if not is_recording():
+            variables = processor(request)
+            _record_variables(name, variables)
+            return variables
+        start = timer_ns()
+        with QueryCounter() as counter:
+            variables = processor(request)
+        duration = timer_ns() - start
+        _record_variables(name, variables)
+        processor_stats.add(name, duration, counter.count, counter.time,
+                            variables)
+        request_records = collector.get_current()
+        if request_records is not None:
+            request_records.processors.append({
+                'name': name,
+                'duration': duration,
+                'queries': counter.count,
+                'variables': sorted(variables),
+            })
+        return variables
+    instrumented_processor._template_debug_instrumented = True
+    instrumented_processor.__name__ = str(getattr(processor, '__name__',
+                                                  'processor'))
+    instrumented_processor.__module__ = getattr(processor, '__module__', None)
+    return instrumented_processor
+
+
+def _record_variables(name, variables):
+    for variable in variables:
+        if _variable_processors.get(variable) != name:
+            _variable_processors[variable] = name
@@ -0,0 +1,375 @@
+"""
+In-process statistics for timing template rendering.
+"""
+
+from __future__ import unicode_literals
+from collections import deque
+from random import random
+from threading import Lock, local
+from time import time
+
+from django.conf import settings
+from django.template.base import FilterExpression, Variable
+
+from template_debug.utils import LRUCache
+
+try:
+    from time import perf_counter_ns as timer_ns
+except ImportError:
+    # Python < 3.7
+    from timeit import default_timer
+
+    def timer_ns():
+        return int(default_timer() * 1e9)
+
+
+# Number of recent durations kept for each key to compute percentiles
+SAMPLE_SIZE = 1000
+
+# Defaults for the settings that control sampling of requests
+SAMPLE_RATE = 1
+SAMPLE_PATH_INTERVAL = 0
+SAMPLE_BUFFER_SIZE = 100
+
+# Maximum number of paths whose last sample time is remembered
+SAMPLE_PATH_CACHE_SIZE = 1024
+
+
+class Stat(object):
+    """
+    Aggregated durations, in nanoseconds, recorded for one key. Percentiles
+    are computed from the most recent `sample_size` durations.
+    """
+
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.samples = deque(maxlen=sample_size)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        self.samples.append(duration)
+
+    def percentile(self, percent):
+        """
+        Given a percentage, return the nearest-rank percentile of the sampled
+        durations, or 0 if nothing was recorded
+        """
+        if not self.samples:
+            return 0
+        samples = sorted(self.samples)
+        rank = int(round(percent / 100.0 * len(samples))) - 1
+        return samples[min(max(rank, 0), len(samples) - 1)]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max,
+        }
+
+
+class StatsTable(object):
+    """
+    A thread safe table of Stat, keyed by a label such as a profile tag label
+    """
+
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._stats = {}
+        self._lock = Lock()
+
+    def add(self, key, duration):
+        with self._lock:
+            try:
+                stat = self._stats[key]
+            except KeyError:
+                stat = self._stats[key] = Stat(self.sample_size)
+            stat.add(duration)
+
+    def get(self, key):
+        """Given a key, return its Stat as a dictionary or None"""
+        with self._lock:
+            stat = self._stats.get(key)
+            return stat.as_dict() if stat is not None else None
+
+    def report(self):
+        """
+        Return a list of (key, stat dictionary) tuples sorted with the largest
+        total duration first
+        """
+        with self._lock:
+            rows = [(key, stat.as_dict()) for key, stat in self._stats.items()]
+        return sorted(rows, key=lambda row: row[1]['total'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Timings recorded by the profile tag
+render_stats = StatsTable()
+
+# Timings of every node recorded by template_debug.loaders.ProfilingLoader
+node_stats = StatsTable()
+
+
+def is_enabled():
+    """
+    Return True if profiling is on, as set by TEMPLATE_DEBUG_PROFILE, which
+    defaults to TEMPLATE_DEBUG
+    """
+    return getattr(settings, 'TEMPLATE_DEBUG_PROFILE',
+                   getattr(settings, 'TEMPLATE_DEBUG', False))
+
+
+class RingBuffer(object):
+    """
+    A thread safe buffer that holds the most recent `size` items
+    """
+
+    def __init__(self, size):
+        self._items = deque(maxlen=size)
+        self._lock = Lock()
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def items(self):
+        """Return a list of the items, oldest first"""
+        with self._lock:
+            return list(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Sample(object):
+    """
+    The timings recorded while rendering the templates of one sampled request
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.time = time()
+        self.timings = {}
+
+    def add(self, key, duration):
+        self.timings[key] = self.timings.get(key, 0) + duration
+
+
+class Sampler(object):
+    """
+    Decides which requests are profiled. One in `rate` requests is chosen at
+    random, and each path is sampled at most once every `path_interval`
+    seconds. The samples of finished requests are kept in a ring buffer of
+    `buffer_size`, so memory use is bounded regardless of traffic.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, path_interval=SAMPLE_PATH_INTERVAL,
+                 buffer_size=SAMPLE_BUFFER_SIZE, random=random, clock=time):
+        self.rate = rate
+        self.path_interval = path_interval
+        self.samples = RingBuffer(buffer_size)
+        self._random = random
+        self._clock = clock
+        self._last_sampled = LRUCache(SAMPLE_PATH_CACHE_SIZE)
+
+    def should_sample(self, path):
+        """Given a request path, return True if the request is profiled"""
+        if self.rate > 1 and self._random() * self.rate >= 1:
+            return False
+        if self.path_interval:
+            now = self._clock()
+            last = self._last_sampled.get(path)
+            if last is not None and now - last < self.path_interval:
+                return False
+            self._last_sampled.set(path, now)
+        return True
+
+
+_sampler = None
+_state = local()
+
+
+def get_sampler():
+    """
+    Return the Sampler configured by the TEMPLATE_DEBUG_PROFILE_SAMPLE_RATE,
+    TEMPLATE_DEBUG_PROFILE_PATH_INTERVAL and TEMPLATE_DEBUG_PROFILE_BUFFER_SIZE
+    settings, creating it on first use
+    """
+    global _sampler
+    if _sampler is None:
+        _sampler = Sampler(
+            getattr(settings, 'TEMPLATE_DEBUG_PROFILE_SAMPLE_RATE',
+                    SAMPLE_RATE),
+            getattr(settings, 'TEMPLATE_DEBUG_PROFILE_PATH_INTERVAL',
+                    SAMPLE_PATH_INTERVAL),
+            getattr(settings, 'TEMPLATE_DEBUG_PROFILE_BUFFER_SIZE',
+                    SAMPLE_BUFFER_SIZE),
+        )
+    return _sampler
+
+
+def start_request(path):
+    """
+    Given the path of a request that is starting on this thread, decide
+    whether its renders are recorded. Return True if it is sampled.
+    """
+    if get_sampler().should_sample(path):
+        _state.sample = Sample(path)
+        return True
+    _state.sample = False
+    return False
+
+
+def finish_request():
+    """
+    Finish the request on this thread, keeping its sample if it was sampled
+    """
+    sample = getattr(_state, 'sample', None)
+    _state.sample = None
+    if sample:
+        get_sampler().samples.append(sample)
+
+
+def get_sample():
+    """Return the Sample of the current request, or None if not sampled"""
+    return getattr(_state, 'sample', None) or None
+
+
+def is_recording():
+    """
+    Return False if the current request was not sampled. Renders outside of a
+    request started with start_request are always recorded.
+    """
+    return getattr(_state, 'sample', None) is not False
+
+
+def record(table, key, duration):
+    """
+    Given a StatsTable, a key and a duration, add the duration to the table
+    and to the sample of the current request, unless it was not sampled
+    """
+    sample = getattr(_state, 'sample', None)
+    if sample is False:
+        return
+    table.add(key, duration)
+    if sample is not None:
+        sample.add(key, duration)
+
+
+class ResolutionCounter(object):
+    """
+    Context manager that counts how many times each variable lookup chain,
+    such as 'order.customer.address.city', is resolved on the current thread
+    and the total time taken. Filtered expressions such as 'total|floatformat'
+    are counted as well, and their time includes resolving their variable.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.totals = {}
+
+    def add(self, key, duration):
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.totals[key] = self.totals.get(key, 0) + duration
+
+    def report(self):
+        """
+        Return a list of (key, count, total nanoseconds) tuples sorted with the
+        largest total first
+        """
+        rows = [(key, self.counts[key], total)
+                for key, total in self.totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def __enter__(self):
+        _patch_resolve()
+        _get_resolution_counters().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _get_resolution_counters().remove(self)
+        _unpatch_resolve()
+
+
+_resolve_lock = Lock()
+_resolve_users = 0
+_original_resolve = {}
+
+
+def _get_resolution_counters():
+    """Return the list of ResolutionCounters active on the current thread"""
+    try:
+        return _state.resolution_counters
+    except AttributeError:
+        counters = _state.resolution_counters = []
+        return counters
+
+
+def _patch_resolve():
+    """
+    Make Variable.resolve and FilterExpression.resolve report to the active
+    ResolutionCounters of the current thread. Calls are reference counted.
+    """
+    global _resolve_users
+    with _resolve_lock:
+        _resolve_users += 1
+        if _resolve_users > 1:
+            return
+        for kls, get_key in ((Variable, _get_variable_key),
+                             (FilterExpression, _get_filter_key)):
+            _original_resolve[kls] = kls.__dict__['resolve']
+            kls.resolve = _counted_resolve(_original_resolve[kls], get_key)
+
+
+def _unpatch_resolve():
+    global _resolve_users
+    with _resolve_lock:
+        _resolve_users -= 1
+        if _resolve_users:
+            return
+        for kls, resolve in _original_resolve.items():
+            kls.resolve = resolve
+        _original_resolve.clear()
+
+
+def _get_variable_key(variable):
+    # Literals such as numbers and quoted strings have no lookups
+    return variable.var if variable.lookups is not None else None
+
+
+def _get_filter_key(filter_expression):
+    return filter_expression.token if filter_expression.filters else None
+
+
+def _counted_resolve(resolve, get_key):
+    """
+    Given a resolve method and a function returning the key of its instance,
+    return a resolve method that times each call for the active counters
+    """
+    def counted_resolve(self, *args, **kwargs):
+        counters = getattr(_state, 'resolution_counters', None)
+        key = get_key(self) if counters else None
+        if key is None:
+            return resolve(self, *args, **kwargs)
+        start = timer_ns()
+        try:
+            return resolve(self, *args, **kwargs)
+        finally:
+            duration = timer_ns() - start
+            for counter in counters:
+                counter.add(key, duration)
+    return counted_resolve
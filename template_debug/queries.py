@@ -0,0 +1,114 @@
+"""
+Helpers for counting the database queries run while a block of code executes.
+"""
+
+from __future__ import unicode_literals
+from timeit import default_timer
+
+from django.db import connections
+
+
+class QueryNotAllowed(Exception):
+    """Raised in place of a query while a strict QueryCounter is active"""
+
+
+class QueryCounter(object):
+    """
+    Context manager that counts the queries run on every database connection
+    and the time they take. If `strict` is True, queries raise
+    QueryNotAllowed instead of being run.
+
+    Uses connection.execute_wrapper when Django provides it, otherwise the
+    cursors of each connection are wrapped for the duration of the block.
+    """
+
+    def __init__(self, strict=False):
+        self.strict = strict
+        self.count = 0
+        self.time = 0.0
+        self.queries = []
+        self._exits = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.strict:
+            raise QueryNotAllowed(sql)
+        start = default_timer()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = default_timer() - start
+            self.count += 1
+            self.time += duration
+            self.queries.append((sql, duration))
+
+    def __enter__(self):
+        for alias in connections:
+            connection = connections[alias]
+            if hasattr(connection, 'execute_wrapper'):
+                wrapper = connection.execute_wrapper(self)
+                wrapper.__enter__()
+                self._exits.append(wrapper.__exit__)
+            else:
+                self._exits.append(_wrap_cursor(connection, self))
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._exits:
+            self._exits.pop()(*exc_info)
+
+
+def _wrap_cursor(connection, wrapper):
+    """
+    Given a connection and an execute wrapper, make the connection's cursors
+    call the wrapper for each query. Return a function that undoes this.
+    """
+    cursor = connection.cursor
+    # Counters may be nested, so restore whatever cursor was set before
+    previous = connection.__dict__.get('cursor')
+
+    def wrapped_cursor(*args, **kwargs):
+        return _CursorProxy(cursor(*args, **kwargs), wrapper, connection)
+    connection.cursor = wrapped_cursor
+
+    def unwrap(*exc_info):
+        if previous is None:
+            del connection.cursor
+        else:
+            connection.cursor = previous
+    return unwrap
+
+
+class _CursorProxy(object):
+    """
+    Wraps a cursor so that execute and executemany are passed through an
+    execute wrapper, as connection.execute_wrapper does in newer Django.
+    """
+
+    def __init__(self, cursor, wrapper, connection):
+        self.cursor = cursor
+        self.wrapper = wrapper
+        self.context = {'connection': connection, 'cursor': cursor}
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def _execute(self, sql, params, many, context):
+        if many:
+            return self.cursor.executemany(sql, params)
+        return self.cursor.execute(sql, params)
+
+    def execute(self, sql, params=None):
+        return self.wrapper(self._execute, sql, params, False, self.context)
+
+    def executemany(self, sql, param_list):
+        return self.wrapper(self._execute, sql, param_list, True,
+                            self.context)
@@ -0,0 +1,159 @@
+"""
+Trees of the templates and blocks rendered by each top level render, as
+recorded by template_debug.loaders.RenderTreeLoader.
+"""
+
+from __future__ import unicode_literals
+from threading import local
+
+from template_debug import collector
+from template_debug.profiling import RingBuffer
+
+# Number of recent render trees kept
+TREE_BUFFER_SIZE = 20
+
+# Maximum number of loads remembered on a thread until their templates render
+LOAD_CACHE_SIZE = 100
+
+_state = local()
+
+
+class RenderNode(object):
+    """
+    A template or block rendered as part of a render tree. `kind` is
+    'template' for a top level render, 'extends', 'include' or 'block'.
+    Durations are in nanoseconds. A template loaded while it was rendered
+    carries its `load_time`, which includes compiling it on a cache miss,
+    and `cached`, True if a cached loader returned a template it had already
+    compiled. Both are None if the template was not loaded for this render.
+    """
+
+    def __init__(self, kind, name, load_time=None, cached=None):
+        self.kind = kind
+        self.name = name
+        self.load_time = load_time
+        self.cached = cached
+        self.duration = 0
+        self.children = []
+
+    @property
+    def exclusive(self):
+        """Return the duration spent in this node outside of its children"""
+        return self.duration - sum(child.duration for child in self.children)
+
+    def walk(self, depth=0):
+        """Generate (depth, node) tuples for this node and its descendants"""
+        stack = [(depth, self)]
+        while stack:
+            depth, node = stack.pop()
+            yield depth, node
+            stack.extend((depth + 1, child) for child in reversed(node.children))
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'inclusive': self.duration,
+            'exclusive': self.exclusive,
+            'load_time': self.load_time,
+            'cached': self.cached,
+            'children': [child.as_dict() for child in self.children],
+        }
+
+
+# The trees of the most recent top level renders
+recent_trees = RingBuffer(TREE_BUFFER_SIZE)
+
+
+def _get_stack():
+    """Return the list of RenderNodes being rendered on the current thread"""
+    try:
+        return _state.stack
+    except AttributeError:
+        stack = _state.stack = []
+        return stack
+
+
+def _get_loads():
+    try:
+        return _state.loads
+    except AttributeError:
+        loads = _state.loads = {}
+        return loads
+
+
+def record_load(template, duration, cached):
+    """
+    Given a template that was just loaded, the time taken to load it and
+    whether it came from a cache, remember them for when it renders
+    """
+    loads = _get_loads()
+    # Templates loaded but never rendered are forgotten
+    if len(loads) >= LOAD_CACHE_SIZE:
+        loads.clear()
+    loads[id(template)] = (duration, cached)
+
+
+def set_kind(kind):
+    """
+    Given the kind of the next template to render on the current thread, such
+    as 'include', set it and return the kind it replaces
+    """
+    previous = getattr(_state, 'kind', None)
+    _state.kind = kind
+    return previous
+
+
+def start_node(name, template=None):
+    """
+    Given the name of a template or block that starts rendering on the current
+    thread and, for a template, the template itself, return its RenderNode,
+    added to the node being rendered
+    """
+    if template is None:
+        node = RenderNode('block', name)
+    else:
+        kind = set_kind(None) or 'template'
+        load_time, cached = _get_loads().pop(id(template), (None, None))
+        node = RenderNode(kind, name, load_time, cached)
+    stack = _get_stack()
+    if stack:
+        stack[-1].children.append(node)
+    stack.append(node)
+    return node
+
+
+def finish_node(node, duration):
+    """
+    Given the RenderNode that finished rendering on the current thread and the
+    time it took, record it. When it is the root, keep the finished tree.
+    """
+    node.duration = duration
+    stack = _get_stack()
+    stack.pop()
+    if stack:
+        return
+    _get_loads().clear()
+    recent_trees.append(node)
+    request_records = collector.get_current()
+    if request_records is not None:
+        request_records.render_trees.append(node)
+
+
+def format_tree(root):
+    """
+    Given the RenderNode at the root of a tree, return a list of lines with
+    its nodes indented by depth, with their inclusive and exclusive times in
+    milliseconds and the load time and cache status of loaded templates
+    """
+    lines = []
+    for depth, node in root.walk():
+        line = '{0}{1} {2}: {3:.3f} ms, {4:.3f} ms self'.format(
+            '  ' * depth, node.kind, node.name, node.duration / 1e6,
+            node.exclusive / 1e6)
+        if node.load_time is not None:
+            line += ', loaded in {0:.3f} ms ({1})'.format(
+                node.load_time / 1e6, 'cache hit' if node.cached else
+                'cache miss')
+        lines.append(line)
+    return lines
@@ -0,0 +1,248 @@
+"""
+Destinations for the output of the debug tags.
+
+The sink is configured with the TEMPLATE_DEBUG_SINK setting, for example::
+
+    TEMPLATE_DEBUG_SINK = {
+        'BACKEND': 'template_debug.sinks.JSONLinesSink',
+        'OPTIONS': {'path': '/tmp/template_debug.jsonl'},
+        'BUFFERED': True,
+    }
+
+By default, output is printed to stdout as it is produced.
+"""
+
+from __future__ import unicode_literals
+import atexit
+import json
+import logging
+from pprint import pformat, pprint
+from threading import Lock, Thread
+from time import time
+
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    # Python 2
+    from Queue import Queue, Empty, Full
+
+from django.conf import settings
+from django.utils.encoding import force_text
+try:
+    from importlib import import_module
+except ImportError:
+    # Python 2.6
+    from django.utils.importlib import import_module
+
+from template_debug.profiling import RingBuffer
+
+
+DEFAULT_SINK = {
+    'BACKEND': 'template_debug.sinks.PrintSink',
+    'OPTIONS': {},
+    'BUFFERED': False,
+}
+
+# Seconds a buffered sink is given to write its records when the process
+# exits, so a stuck sink can not hang the shutdown
+EXIT_FLUSH_TIMEOUT = 5
+
+
+class Record(object):
+    """
+    The output of one debug tag. `data` is formatted for display by calling
+    `formatter`, which returns a list of lines, only when a sink needs it.
+    If `prepare` is given, the data emitted is replaced by prepare(data) when
+    it is first read, which a BufferedSink does from its own thread.
+    """
+    __slots__ = ('tag', '_data', 'formatter', 'time', '_prepare')
+
+    def __init__(self, tag, data, formatter=None, prepare=None):
+        self.tag = tag
+        self._data = data
+        self.formatter = formatter
+        self.time = time()
+        self._prepare = prepare
+
+    @property
+    def data(self):
+        if self._prepare is not None:
+            self._data = self._prepare(self._data)
+            self._prepare = None
+        return self._data
+
+    def lines(self):
+        if self.formatter is None:
+            return [self.data]
+        return self.formatter(self.data)
+
+    def as_dict(self):
+        return {'tag': self.tag, 'time': self.time, 'data': self.data}
+
+
+class BaseSink(object):
+    """Base class for sinks, which receive Records from emit"""
+
+    def emit(self, record):
+        raise NotImplementedError('subclasses of BaseSink must provide an '
+                                  'emit() method')
+
+    def emit_batch(self, records):
+        for record in records:
+            self.emit(record)
+
+    def flush(self):
+        pass
+
+
+class PrintSink(BaseSink):
+    """Pretty prints each line of a record to stdout"""
+
+    def emit(self, record):
+        for line in record.lines():
+            pprint(line)
+
+
+class LoggingSink(BaseSink):
+    """Logs each record as one message to the given logger"""
+
+    def __init__(self, logger='template_debug', level=logging.DEBUG):
+        self.logger = logging.getLogger(logger)
+        self.level = level
+
+    def emit(self, record):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, '\n'.join(
+                pformat(line) for line in record.lines()))
+
+
+class JSONLinesSink(BaseSink):
+    """
+    Appends each record to a file as a line of JSON. Values that can not be
+    serialized are written as text.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records):
+        lines = [json.dumps(record.as_dict(), default=force_text) + '\n'
+                 for record in records]
+        with self._lock:
+            with open(self.path, 'a') as output:
+                output.writelines(lines)
+
+
+class MemorySink(BaseSink):
+    """Keeps the most recent `size` records in memory"""
+
+    def __init__(self, size=100):
+        self.buffer = RingBuffer(size)
+
+    def emit(self, record):
+        self.buffer.append(record)
+
+    def records(self):
+        return self.buffer.items()
+
+
+class BufferedSink(BaseSink):
+    """
+    Hands records to another sink in batches from a background thread, so
+    emitting a record never waits on I/O. Records are dropped, and counted in
+    `dropped`, if more than `queue_size` are waiting.
+    """
+
+    def __init__(self, sink, batch_size=100, queue_size=10000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = Queue(queue_size)
+        self._thread = Thread(target=self._run, name='template_debug sink')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """
+        Block until every record emitted so far has been written, or for at
+        most `timeout` seconds if given. Return False if the records were not
+        all written in time.
+        """
+        if timeout is None:
+            self._queue.join()
+            self.sink.flush()
+            return True
+        waiter = Thread(target=self.flush, name='template_debug sink flush')
+        waiter.daemon = True
+        waiter.start()
+        waiter.join(timeout)
+        return not waiter.is_alive()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                self.sink.emit_batch(batch)
+            except Exception:
+                logging.getLogger('template_debug').exception(
+                    'Unable to write debug output')
+            finally:
+                for record in batch:
+                    self._queue.task_done()
+
+
+_sink = None
+_sink_lock = Lock()
+
+
+def get_sink():
+    """Return the sink configured by TEMPLATE_DEBUG_SINK, creating it once"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = _create_sink(getattr(settings, 'TEMPLATE_DEBUG_SINK',
+                                             DEFAULT_SINK))
+    return _sink
+
+
+def _create_sink(config):
+    module_name, class_name = config.get(
+        'BACKEND', DEFAULT_SINK['BACKEND']).rsplit('.', 1)
+    backend = getattr(import_module(module_name), class_name)
+    sink = backend(**config.get('OPTIONS', {}))
+    if config.get('BUFFERED', False):
+        sink = BufferedSink(sink)
+        atexit.register(sink.flush, EXIT_FLUSH_TIMEOUT)
+    return sink
+
+
+def reset_sink():
+    """Forget the current sink, so it is created again from the settings"""
+    global _sink
+    with _sink_lock:
+        _sink = None
+
+
+def emit(tag, data, formatter=None, prepare=None):
+    """
+    Given the name of a tag, its output and optionally a function that returns
+    the output as a list of lines and one that prepares it when first read,
+    send it to the configured sink
+    """
+    get_sink().emit(Record(tag, data, formatter, prepare))
@@ -0,0 +1,231 @@
+"""
+Snapshots of the context of a render, written to compressed files by the
+{% snapshot %} tag and opened offline with the open_snapshot command.
+"""
+
+from __future__ import unicode_literals
+import gzip
+import json
+import logging
+import os
+import re
+import stat
+from itertools import count
+from tempfile import gettempdir
+from threading import Lock, Thread
+from time import localtime, strftime, time
+
+try:
+    from queue import Queue, Full
+except ImportError:
+    # Python 2
+    from Queue import Queue, Full
+
+from django.conf import settings
+from django.utils.encoding import force_text
+
+from template_debug.queries import QueryCounter
+from template_debug.utils import (PY3, BoundedRepr, bound_details,
+    bounded_repr, get_details, get_variable_index)
+
+
+# Changing what snapshots hold must change this
+SNAPSHOT_VERSION = 1
+
+# Default directory that snapshots are written to
+SNAPSHOT_DIR = os.path.join(gettempdir(), 'template_debug_snapshots')
+
+# Number of costly attributes, such as properties, read for each variable
+SNAPSHOT_BUDGET = 10
+
+# Maximum number of snapshots waiting to be written
+SNAPSHOT_QUEUE_SIZE = 100
+
+_ids = count(1)
+
+
+def capture(context, template_name, line):
+    """
+    Given a context and the name and line of the template being rendered,
+    return a snapshot of its variable index and the bounded details and repr
+    of each variable. Attributes and reprs that would query the database,
+    including those of QuerySets, are left unevaluated, and the body of a
+    request is not read.
+    """
+    index = get_variable_index(context)
+    variables = {}
+    for name in index:
+        value = context[name]
+        details = bound_details(get_details(value, budget=SNAPSHOT_BUDGET,
+                                            strict=True), strict=True)
+        with QueryCounter(strict=True):
+            value_repr = bounded_repr(value)
+        variables[name] = {
+            'repr': value_repr,
+            'meta': dict((key[5:], details.pop(key))
+                         for key in list(details) if key.startswith('META_')),
+            'attributes': details,
+        }
+    return {
+        'version': SNAPSHOT_VERSION,
+        'time': time(),
+        'template': template_name,
+        'line': line,
+        'index': index,
+        'variables': variables,
+    }
+
+
+def get_snapshot_dir():
+    """
+    Return the directory snapshots are written to, as set by
+    TEMPLATE_DEBUG_SNAPSHOT_DIR
+    """
+    return getattr(settings, 'TEMPLATE_DEBUG_SNAPSHOT_DIR', SNAPSHOT_DIR)
+
+
+def get_snapshot_path(snapshot, directory):
+    """
+    Given a snapshot and a directory, return a unique path for its file,
+    named after its time, template and line
+    """
+    name = re.sub(r'[^\w.-]+', '_', '{0}-{1}'.format(snapshot['template'],
+                                                      snapshot['line']))
+    return os.path.join(directory, '{0}-{1}-{2}-{3}.json.gz'.format(
+        strftime('%Y%m%d-%H%M%S', localtime(snapshot['time'])), name,
+        os.getpid(), next(_ids)))
+
+
+def write_snapshot(snapshot, path):
+    """
+    Given a snapshot and a path, write it as gzipped JSON, readable by the
+    current user only, as snapshots hold values such as password hashes
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        check_snapshot_dir(directory)
+    data = json.dumps(snapshot, default=force_text, separators=(',', ':'))
+    # Readers never see a partly written file, and O_EXCL refuses to follow
+    # a link planted at the temporary path
+    descriptor = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                         getattr(os, 'O_BINARY', 0), 0o600)
+    with os.fdopen(descriptor, 'wb') as raw_file:
+        with gzip.GzipFile(fileobj=raw_file, mode='wb') as snapshot_file:
+            snapshot_file.write(data.encode('utf-8'))
+    os.rename(path + '.tmp', path)
+
+
+def check_snapshot_dir(directory):
+    """
+    Given a directory, create it accessible by the current user only if it
+    does not exist. Raise IOError if it is a link or owned by another user,
+    who could read the snapshots written to it.
+    """
+    try:
+        os.makedirs(directory, 0o700)
+    except OSError:
+        # Created meanwhile by another thread or process
+        if not os.path.isdir(directory):
+            raise
+    status = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode):
+        raise IOError('Snapshot directory {0} is not a directory'.format(
+            directory))
+    # Windows has no owners to compare
+    if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+        raise IOError('Snapshot directory {0} is owned by another '
+                      'user'.format(directory))
+
+
+def read_snapshot(path):
+    """Given the path of a snapshot file, return the snapshot"""
+    with gzip.open(path, 'rb') as snapshot_file:
+        return json.loads(snapshot_file.read().decode('utf-8'))
+
+
+class SnapshotWriter(object):
+    """
+    Writes snapshots from a background thread, so taking one never waits on
+    I/O. Snapshots are dropped, and counted in `dropped`, if more than
+    `queue_size` are waiting.
+    """
+
+    def __init__(self, queue_size=SNAPSHOT_QUEUE_SIZE):
+        self.dropped = 0
+        self._queue = Queue(queue_size)
+        self._thread = Thread(target=self._run, name='template_debug snapshots')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, snapshot, directory):
+        """
+        Given a snapshot and a directory, queue it to be written there and
+        return its path, or None if it was dropped
+        """
+        path = get_snapshot_path(snapshot, directory)
+        try:
+            self._queue.put_nowait((snapshot, path))
+        except Full:
+            self.dropped += 1
+            return None
+        return path
+
+    def flush(self):
+        """Block until every snapshot queued so far has been written"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            snapshot, path = self._queue.get()
+            try:
+                write_snapshot(snapshot, path)
+            except Exception:
+                logging.getLogger('template_debug').exception(
+                    'Unable to write snapshot %s', path)
+            finally:
+                self._queue.task_done()
+
+
+_writer = None
+_writer_lock = Lock()
+
+
+def get_writer():
+    """Return the SnapshotWriter, starting it on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SnapshotWriter()
+    return _writer
+
+
+class SnapshotValue(dict):
+    """
+    A variable of a snapshot opened offline: a dictionary of the bounded
+    reprs of its attributes that displays as the bounded repr of the
+    variable. Templates rendered against it read its attributes as keys.
+    """
+
+    def __init__(self, variable):
+        super(SnapshotValue, self).__init__(variable['attributes'])
+        self.repr = BoundedRepr(variable['repr'])
+        self.meta = variable['meta']
+
+    def __repr__(self):
+        return repr(self.repr)
+
+    def __str__(self):
+        return self.repr if PY3 else self.repr.encode('utf-8')
+
+    def __unicode__(self):
+        return self.repr
+
+
+def get_snapshot_values(snapshot):
+    """
+    Given a snapshot, return a dictionary mapping the name of each variable
+    to its SnapshotValue
+    """
+    return dict((name, SnapshotValue(variable))
+                for name, variable in snapshot['variables'].items())
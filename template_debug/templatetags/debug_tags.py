@@ -4,13 +4,30 @@ Template tags that aid in common debugging scenarios.
 
 from __future__ import unicode_literals
 
+from functools import partial
 from pprint import pprint
 
 from django.conf import settings
 from django import template
+from django.template.defaultfilters import filesizeformat
+from django.template.defaulttags import TemplateIfParser
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
 import socket
 
-from template_debug.utils import get_variables, get_details, get_attributes
+from template_debug.utils import (bound_details, format_variable_index,
+    get_variables, get_variable_index, get_details, introspect)
+from template_debug.profiling import (is_enabled, is_recording, record,
+    render_stats, timer_ns, ResolutionCounter)
+from template_debug.nplusone import (LoopQueryDetector, track_nodes,
+    track_block_overrides)
+from template_debug.memory import MEMORY_OBJECT_BUDGET, get_context_memory
+from template_debug.usage import UsageTracker, usage_stats
+from template_debug.processors import processor_stats
+from template_debug.snapshots import capture, get_snapshot_dir, get_writer
+from template_debug.loaders import LineNumbers, get_template_name
+from template_debug.sinks import emit
+from template_debug.debugger import get_probe
 
 register = template.Library()
 
@@ -23,106 +40,570 @@ def require_template_debug(f):
     return _
 
 
-def _display_details(var_data):
+class EmptyNode(template.Node):
+    """Renders nothing. Shared by every debug tag compiled while disabled."""
+
+    def __repr__(self):
+        return '<Empty Node>'
+
+    def render(self, context):
+        return ''
+
+
+EMPTY_NODE = EmptyNode()
+
+
+class ContentNode(template.Node):
+    """Renders its child nodes as is. Used by debug block tags when disabled."""
+
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def __repr__(self):
+        return '<Content Node>'
+
+    def render(self, context):
+        return self.nodelist.render(context)
+
+
+def compile_if_template_debug(f):
+    """
+    Decorated tag compiles to EMPTY_NODE if TEMPLATE_DEBUG is False, so using
+    it costs nothing at render time. Apply it to a newly registered tag.
+    """
+    compile_function = register.tags[f.__name__]
+
+    def _(parser, token):
+        if not getattr(settings, 'TEMPLATE_DEBUG', False):
+            return EMPTY_NODE
+        return compile_function(parser, token)
+    register.tags[f.__name__] = _
+    return f
+
+
+def _display_details(var_data, strict=False):
+    """
+    Given a dictionary of variable attribute data from get_details send the
+    data to the output sink. META_ keys are moved out of the dictionary. The
+    values are only shortened by bound_details when the sink reads them.
+    """
+    meta = dict((key[5:].capitalize(), var_data.pop(key))
+                for key in list(var_data.keys()) if key.startswith('META_'))
+    emit('details', {'meta': meta, 'attributes': var_data}, _format_details,
+         partial(_bound_details, strict=strict))
+
+
+def _bound_details(data, strict):
     """
-    Given a dictionary of variable attribute data from get_details display the
-    data in the terminal.
+    Given the output of _display_details, return it with the attributes
+    shortened by bound_details
     """
-    meta_keys = (key for key in list(var_data.keys())
-                 if key.startswith('META_'))
-    for key in meta_keys:
-        display_key = key[5:].capitalize()
-        pprint('{0}: {1}'.format(display_key, var_data.pop(key)))
-    pprint(var_data)
+    return {'meta': data['meta'],
+            'attributes': bound_details(data['attributes'], strict)}
+
+
+def _format_details(data):
+    """Given the output of _display_details, return the lines to display"""
+    lines = ['{0}: {1}'.format(key, value)
+             for key, value in sorted(data['meta'].items())]
+    lines.append(data['attributes'])
+    return lines
 
 
 @require_template_debug
+@compile_if_template_debug
 @register.simple_tag(takes_context=True)
-def variables(context):
+def variables(context, layers=False):
     """
     Given a context, return a flat list of variables available in the context.
+    If layers is True, return a dictionary that maps each variable to the
+    indexes of the context layers that provide it, the first of which is used.
     """
+    if layers:
+        index = get_variable_index(context)
+        emit('variables', index, format_variable_index)
+        return index
     availables = get_variables(context)
-    pprint(availables)
+    emit('variables', availables)
     return availables
 
 
 @require_template_debug
+@compile_if_template_debug
 @register.simple_tag
-def attributes(var):
+def attributes(var, evaluate=True, budget=None, strict=False):
     """
     Given a variable in the template's context, print and return the list of
     attributes thare accessible inside of the template. For example, private
-    attributes or callables that require arguments are excluded.
+    attributes or callables that require arguments are excluded. Attributes
+    that were not read are marked as unevaluated, e.g. 'name (unevaluated
+    property)'.
     """
-    attrs = get_attributes(var)
-    pprint(attrs)
+    attrs = ['{0} (unevaluated {1})'.format(attr, value)
+             if kind == 'unevaluated' else attr
+             for attr, value, kind in introspect(var, evaluate, budget, strict)]
+    emit('attributes', attrs)
     return attrs
 
 
 @require_template_debug
+@compile_if_template_debug
 @register.simple_tag
-def details(var):
+def details(var, evaluate=True, budget=None, strict=False, queries=False,
+            explain=False):
     """
     Prints a dictionary showing the attributes of a variable, and if possible,
-    their corresponding values.
+    their corresponding values. Values are shortened by bounded_repr when the
+    output is written, off the render path if the sink is buffered.
+    """
+    _display_details(get_details(var, evaluate, budget, strict, queries,
+                                 explain), strict)
+    return ''
+
+
+class BreakpointNode(template.Node):
+    """
+    Base class for the nodes of tags that stop or capture a render. The node
+    triggers only if its `condition`, compiled when the template is, holds.
+    Of the renders where it holds, the first `after` are skipped and then
+    only one in `every` triggers. Renders are counted per template render.
+    """
+
+    def __init__(self, condition=None, every=None, after=None):
+        self.condition = condition
+        self.every = every
+        self.after = after
+
+    def render(self, context):
+        if self.condition is not None and not self.condition.eval(context):
+            return ''
+        if self.every or self.after:
+            hits = context.render_context.get(self, 0) + 1
+            context.render_context[self] = hits
+            after = self.after or 0
+            if hits <= after or self.every and (hits - after) % self.every:
+                return ''
+        self.trigger(context)
+        return ''
+
+    def trigger(self, context):
+        raise NotImplementedError('subclasses of BreakpointNode must provide '
+                                  'a trigger() method')
+
+
+def _parse_breakpoint(parser, token):
+    """
+    Given the parser and token of a breakpoint tag, return the keyword
+    arguments of its BreakpointNode from its 'every N', 'after N' and
+    'if <condition>' options, in that order
+    """
+    bits = token.split_contents()
+    tag_name, bits = bits[0], bits[1:]
+    options = {}
+    while bits[:1] in (['every'], ['after']):
+        name = bits.pop(0)
+        minimum = 1 if name == 'every' else 0
+        try:
+            number = int(bits.pop(0))
+        except (IndexError, ValueError):
+            number = None
+        if number is None or number < minimum:
+            raise template.TemplateSyntaxError(
+                "'{0}' tag requires a whole number of at least {1} after "
+                "'{2}'".format(tag_name, minimum, name))
+        options[name] = number
+    if bits:
+        if bits[0] != 'if' or len(bits) < 2:
+            raise template.TemplateSyntaxError(
+                "'{0}' tag takes 'every N', 'after N' and 'if <condition>' "
+                "options".format(tag_name))
+        options['condition'] = TemplateIfParser(parser, bits[1:]).parse()
+    return options
+
+
+class SetTraceNode(BreakpointNode):
+    """
+    Starts a pdb set_trace inside of the template with the context available
+    as 'context'. Uses ipdb if available.
+    """
+
+    def __repr__(self):
+        return '<Set Trace Node>'
+
+    def trigger(self, context):
+        try:
+            import ipdb as pdb
+        except ImportError:
+            import pdb
+            print("For best results, pip install ipdb.")
+        print("Variables that are available in the current context:")
+        render = lambda s: template.Template(s).render(context)
+        index = get_variable_index(context)
+
+        def layers():
+            for line in format_variable_index(index):
+                print(line)
+        availables = list(index)
+        pprint(availables)
+        print('Type `availables` to show this list.')
+        print('Type `layers()` to show the context layer that provides each '
+              'variable.')
+        print('Type <variable_name> to access one.')
+        print('Use render("template string") to test template rendering')
+        # Cram context variables into the local scope
+        for var in availables:
+            locals()[var] = context[var]
+        pdb.set_trace()
+
+
+@compile_if_template_debug
+@register.tag
+def set_trace(parser, token):
+    """
+    Start a pdb set_trace inside of the template with the context available as
+    'context'. Uses ipdb if available. The options limit which renders stop.
+
+    Usage: {% set_trace [every N] [after N] [if <condition>] %}
+    """
+    return SetTraceNode(**_parse_breakpoint(parser, token))
+
+
+class SnapshotNode(BreakpointNode):
+    """
+    Captures the context into a snapshot file, written in the background,
+    and renders nothing
+    """
+
+    def __repr__(self):
+        return '<Snapshot Node>'
+
+    def trigger(self, context):
+        snapshot = capture(context, get_template_name(self),
+                           self._get_line())
+        path = get_writer().write(snapshot, get_snapshot_dir())
+        emit('snapshot', path or 'Snapshot dropped, too many are waiting')
+
+    def _get_line(self):
+        try:
+            return self._line
+        except AttributeError:
+            self._line = LineNumbers().get(self)
+            return self._line
+
+
+@compile_if_template_debug
+@register.tag
+def snapshot(parser, token):
+    """
+    Write the variable index of the context, the bounded details of each
+    variable and the template name and line to a compressed file, without
+    stopping the render. Open it later with the open_snapshot command. The
+    options limit which renders are captured, as for set_trace.
+
+    Usage: {% snapshot [every N] [after N] [if <condition>] %}
+    """
+    return SnapshotNode(**_parse_breakpoint(parser, token))
+
+
+class ProfileNode(template.Node):
+    """
+    Renders its child nodes, recording the time taken by the block as a whole
+    and by each child node in render_stats under the given label
+    """
+
+    def __init__(self, label, nodelist):
+        self.label = label
+        self.nodelist = nodelist
+        # Keys are fixed when the template is compiled, so render_stats can
+        # not grow with the values rendered
+        self.keys = ['{0}[{1}] {2!r}'.format(label, index, node)
+                     for index, node in enumerate(nodelist)]
+
+    def __repr__(self):
+        return '<Profile Node>'
+
+    def render(self, context):
+        if not is_recording():
+            return self.nodelist.render(context)
+        bits = []
+        start = timer_ns()
+        for node, key in zip(self.nodelist, self.keys):
+            node_start = timer_ns()
+            bits.append(force_text(_render_node(self.nodelist, node, context)))
+            record(render_stats, key, timer_ns() - node_start)
+        record(render_stats, self.label, timer_ns() - start)
+        return mark_safe(''.join(bits))
+
+
+def _render_node(nodelist, node, context):
+    """
+    Given a nodelist and one of its nodes, render the node the same way the
+    nodelist would
+    """
+    if not isinstance(node, template.Node):
+        return node
+    render_node = getattr(nodelist, 'render_node', None)
+    if render_node is not None:
+        return render_node(node, context)
+    # Django >= 1.9
+    return node.render_annotated(context)
+
+
+@register.tag
+def profile(parser, token):
     """
-    var_details = get_details(var)
-    _display_details(var_details)
-    return var_details
+    Time the rendering of the enclosed block and of each of its child nodes.
+    The timings are aggregated per label across requests in
+    template_debug.profiling.render_stats.
+
+    Usage: {% profile "label" %}...{% endprofile %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            "'{0}' tag requires a label".format(bits[0]))
+    # A label resolved from the context would add keys for each value
+    label = bits[1]
+    if len(label) < 2 or label[0] not in '"\'' or label[-1] != label[0]:
+        raise template.TemplateSyntaxError(
+            "'{0}' tag requires a quoted string as its label".format(bits[0]))
+    label = label[1:-1]
+    nodelist = parser.parse(('endprofile',))
+    parser.delete_first_token()
+    if not is_enabled():
+        return ContentNode(nodelist)
+    return ProfileNode(label, nodelist)
+
+
+class ResolutionsNode(template.Node):
+    """
+    Renders its child nodes while counting the variable resolutions they make,
+    then prints the counts and times sorted by cumulative time
+    """
+
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def __repr__(self):
+        return '<Resolutions Node>'
+
+    def render(self, context):
+        with ResolutionCounter() as counter:
+            output = self.nodelist.render(context)
+        emit('resolutions', counter.report(), _format_resolutions)
+        return output
+
+
+def _format_resolutions(report):
+    """
+    Given a report from ResolutionCounter return a line for each lookup with
+    its number of resolutions and total time.
+    """
+    return ['{0}: {1} resolutions, {2:.3f} ms'.format(key, count, total / 1e6)
+            for key, count, total in report]
+
+
+@register.tag
+def resolutions(parser, token):
+    """
+    Count how many times each variable lookup chain in the enclosed block is
+    resolved and the total time taken, and print the lookups sorted by
+    cumulative time.
+
+    Usage: {% resolutions %}...{% endresolutions %}
+    """
+    nodelist = parser.parse(('endresolutions',))
+    parser.delete_first_token()
+    if not getattr(settings, 'TEMPLATE_DEBUG', False):
+        return ContentNode(nodelist)
+    return ResolutionsNode(nodelist)
+
+
+class NPlusOneNode(template.Node):
+    """
+    Renders its child nodes while recording the queries they run, then prints
+    the queries that were repeated inside of a {% for %} loop
+    """
+
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def __repr__(self):
+        return '<NPlusOne Node>'
+
+    def render(self, context):
+        # Blocks of the child templates render in place of those enclosed
+        track_block_overrides(context)
+        with LoopQueryDetector() as detector:
+            output = self.nodelist.render(context)
+        emit('nplusone', detector.repeated(), _format_loop_queries)
+        return output
+
+
+def _format_loop_queries(rows):
+    """
+    Given rows from LoopQueryDetector.repeated return lines showing the
+    repeated queries grouped by the loop that ran them.
+    """
+    loops = {}
+    for row in rows:
+        loops.setdefault(row['loop'], []).append(row)
+    lines = []
+    for loop, loop_rows in loops.items():
+        lines.append('Loop: {0}'.format(loop))
+        lines.extend('{0} queries from {1}: {2}'.format(
+            row['count'], row['node'], row['sql']) for row in loop_rows)
+    return lines
+
+
+@register.tag
+def nplusone(parser, token):
+    """
+    Print the database queries that are run repeatedly inside of {% for %}
+    loops in the enclosed block, grouped by loop, along with the template
+    line that ran them.
+
+    Usage: {% nplusone %}...{% endnplusone %}
+    """
+    nodelist = parser.parse(('endnplusone',))
+    parser.delete_first_token()
+    if not getattr(settings, 'TEMPLATE_DEBUG', False):
+        return ContentNode(nodelist)
+    track_nodes(nodelist)
+    return NPlusOneNode(nodelist)
+
+
+class UnusedVariablesNode(template.Node):
+    """
+    Renders its child nodes while tracking the context variables they read,
+    then prints the variables that were never read, grouped by layer
+    """
+
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def __repr__(self):
+        return '<Unused Variables Node>'
+
+    def render(self, context):
+        with UsageTracker(context) as tracker:
+            output = self.nodelist.render(context)
+        usage_stats.add(tracker)
+        emit('unused_variables', tracker.unused, _format_unused_variables)
+        return output
+
+
+def _format_unused_variables(unused):
+    """
+    Given the unused variables of a UsageTracker return a line for each layer
+    that provided variables that were not read.
+    """
+    return ['{0}: {1}'.format(label, ', '.join(names))
+            for label, names in unused.items() if names]
+
+
+@register.tag
+def unused_variables(parser, token):
+    """
+    Print the context variables that the enclosed block never reads, grouped
+    by the context layer that provided them. Counts across renders are kept
+    in template_debug.usage.usage_stats.
+
+    Usage: {% unused_variables %}...{% endunused_variables %}
+    """
+    nodelist = parser.parse(('endunused_variables',))
+    parser.delete_first_token()
+    if not getattr(settings, 'TEMPLATE_DEBUG', False):
+        return ContentNode(nodelist)
+    return UnusedVariablesNode(nodelist)
+
+
+def _format_context_memory(rows):
+    """
+    Given rows from get_context_memory return a ranked line for each
+    variable with its size, number of objects and layer.
+    """
+    return ['{0}. {1}: {2}{3} in {4} objects (layer {5})'.format(
+        rank, row['name'], '' if row['complete'] else 'at least ',
+        filesizeformat(row['size']), row['objects'], row['layer'])
+        for rank, row in enumerate(rows, 1)]
 
 
 @require_template_debug
+@compile_if_template_debug
 @register.simple_tag(takes_context=True)
-def set_trace(context):
+def context_memory(context, limit=10, budget=MEMORY_OBJECT_BUDGET):
     """
-    Start a pdb set_trace inside of the template with the context available as
-    'context'. Uses ipdb if available.
-    """
-    try:
-        import ipdb as pdb
-    except ImportError:
-        import pdb
-        print("For best results, pip install ipdb.")
-    print("Variables that are available in the current context:")
-    render = lambda s: template.Template(s).render(context)
-    availables = get_variables(context)
-    pprint(availables)
-    print('Type `availables` to show this list.')
-    print('Type <variable_name> to access one.')
-    print('Use render("template string") to test template rendering')
-    # Cram context variables into the local scope
-    for var in availables:
-        locals()[var] = context[var]
-    pdb.set_trace()
+    Print the `limit` context variables that keep the most memory alive,
+    counting the objects they reference, with the layer that provides each.
+    At most `budget` objects are counted per variable.
+    """
+    rows = get_context_memory(context, budget)[:limit]
+    emit('context_memory', rows, _format_context_memory)
     return ''
 
 
-#cache a socket error when doing pydevd.settrace, to allow running without debugger
-pdevd_not_available = False
+def _format_processors(rows):
+    """
+    Given rows from ProcessorStats.report return a line for each context
+    processor with its timings, queries and the variables it contributes.
+    """
+    return ['{0}: {1} calls, {2:.3f} ms total, p50 {3:.3f} ms, p95 {4:.3f} ms, '
+            '{5} queries, provides {6}'.format(
+                row['name'], row['count'], row['total'] / 1e6,
+                row['p50'] / 1e6, row['p95'] / 1e6, row['queries'],
+                ', '.join(row['variables']))
+            for row in rows]
 
 
 @require_template_debug
-@register.simple_tag(takes_context=True)
-def pydevd(context):
+@compile_if_template_debug
+@register.simple_tag
+def processors():
     """
-    Start a pydev settrace
+    Print the cost of each context processor aggregated across requests,
+    as recorded while ProfilingMiddleware is installed and profiling is on.
     """
-    global pdevd_not_available
-    if pdevd_not_available:
-        return ''
-    try:
-        import pydevd
-    except ImportError:
-        pdevd_not_available = True
-        return ''
-    render = lambda s: template.Template(s).render(context)
-    availables = get_variables(context)
-    for var in availables:
-        locals()[var] = context[var]
-    #catch the case where no client is listening
-    try:
-        pydevd.settrace()
-    except socket.error:
-        pdevd_not_available = True
+    emit('processors', processor_stats.report(), _format_processors)
     return ''
+
+
+class PydevdNode(BreakpointNode):
+    """
+    Starts a pydev settrace if a debugger was found listening. Renders never
+    wait longer than TEMPLATE_DEBUG_PYDEVD_TIMEOUT for one to be found.
+    """
+
+    def __repr__(self):
+        return '<Pydevd Node>'
+
+    def trigger(self, context):
+        probe = get_probe()
+        if not probe.is_available():
+            return
+        try:
+            import pydevd
+        except ImportError:
+            probe.mark_failed()
+            return
+        render = lambda s: template.Template(s).render(context)
+        availables = get_variables(context)
+        for var in availables:
+            locals()[var] = context[var]
+        #catch the case where the client stopped listening
+        try:
+            pydevd.settrace(probe.host, port=probe.port)
+        except socket.error:
+            probe.mark_failed()
+
+
+@compile_if_template_debug
+@register.tag
+def pydevd(parser, token):
+    """
+    Start a pydev settrace. The options limit which renders stop, as for
+    set_trace.
+
+    Usage: {% pydevd [every N] [after N] [if <condition>] %}
+    """
+    return PydevdNode(**_parse_breakpoint(parser, token))
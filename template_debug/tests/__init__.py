@@ -1,2 +1,16 @@
 from .test_utils import *
 from .test_tags import *
+from .test_queries import *
+from .test_profiling import *
+from .test_loaders import *
+from .test_nplusone import *
+from .test_sinks import *
+from .test_benchmarks import *
+from .test_memory import *
+from .test_collector import *
+from .test_analysis import *
+from .test_usage import *
+from .test_processors import *
+from .test_render_tree import *
+from .test_snapshots import *
+from .test_debugger import *
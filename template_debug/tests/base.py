@@ -2,10 +2,37 @@
 import random
 import string
 
+from django.conf import settings
 from django.template import RequestContext
 from django.contrib.auth.models import User
 from django.test import TestCase
 
+from template_debug.sinks import get_sink, reset_sink
+
+
+class use_memory_sink(object):
+    """
+    Context manager that sends the output of the debug tags to a new sink,
+    a MemorySink created with `options` unless another `backend` is given,
+    and returns it. The previous sink is restored on exit.
+    """
+
+    def __init__(self, backend='template_debug.sinks.MemorySink', **options):
+        self.sink_settings = {'BACKEND': backend, 'OPTIONS': options}
+
+    def __enter__(self):
+        self.previous = getattr(settings, 'TEMPLATE_DEBUG_SINK', None)
+        settings.TEMPLATE_DEBUG_SINK = self.sink_settings
+        reset_sink()
+        return get_sink()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.previous is None:
+            del settings.TEMPLATE_DEBUG_SINK
+        else:
+            settings.TEMPLATE_DEBUG_SINK = self.previous
+        reset_sink()
+
 
 class TemplateDebugTestCase(TestCase):
     "Base test case with helpers for template debug tests."
@@ -0,0 +1,262 @@
+"""
+Benchmarks of the introspection utilities and the debug tags against
+realistic inputs. Run them with runbenchmarks.py at the root of the project.
+"""
+
+from __future__ import unicode_literals
+import gc
+import json
+import platform
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4
+    tracemalloc = None
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.template import Context, Template
+
+from template_debug.tests.base import use_memory_sink
+from template_debug.utils import (_flatten, get_attributes, get_details,
+    get_variable_index, get_variables)
+
+
+# A benchmark is run for at least this many seconds per repeat
+MIN_TIME = 0.2
+REPEAT = 3
+
+# A change in throughput or peak memory larger than this fraction of the
+# baseline is a regression
+THRESHOLD = 0.2
+
+LAYERS = 40
+VARIABLES_PER_LAYER = 25
+ATTRIBUTES = 300
+GROUPS = 20
+PERMISSIONS = 60
+
+
+class Benchmark(object):
+    """A named function to measure, called without arguments"""
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def run(self, min_time=MIN_TIME, repeat=REPEAT):
+        """
+        Return a dictionary with the best number of calls per second over
+        `repeat` runs and the peak number of bytes allocated by one call, or
+        None if memory can not be traced on this version of Python
+        """
+        number = self._calibrate(min_time)
+        best = min(self._time(number) for x in range(repeat))
+        return {
+            'ops': number / best if best else float('inf'),
+            'peak_bytes': self._trace(),
+        }
+
+    def _time(self, number):
+        function = self.function
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = default_timer()
+            for x in range(number):
+                function()
+            return default_timer() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _calibrate(self, min_time):
+        """Return the number of calls that take at least min_time"""
+        number = 1
+        while True:
+            if self._time(number) >= min_time or number >= 10 ** 6:
+                return number
+            number *= 2
+
+    def _trace(self):
+        if tracemalloc is None:
+            return None
+        self.function()  # Warm caches so only the call itself is measured
+        tracemalloc.start()
+        try:
+            start, peak = tracemalloc.get_traced_memory()
+            self.function()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak - start
+
+
+def compare(results, baselines, threshold=THRESHOLD):
+    """
+    Given the results of run_benchmarks and baselines in the same form,
+    return a list of (name, measure, baseline, result) tuples for each
+    measure that regressed by more than `threshold`
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        if result['ops'] < baseline['ops'] * (1 - threshold):
+            regressions.append((name, 'ops', baseline['ops'], result['ops']))
+        if None not in (result['peak_bytes'], baseline['peak_bytes']) and \
+                result['peak_bytes'] > baseline['peak_bytes'] * (1 + threshold):
+            regressions.append((name, 'peak_bytes', baseline['peak_bytes'],
+                                result['peak_bytes']))
+    return regressions
+
+
+def get_environment():
+    """
+    Return a key for the versions of Python and Django, as baselines are only
+    comparable between runs on the same versions
+    """
+    return 'python {0} django {1}'.format(platform.python_version(),
+                                          django.get_version())
+
+
+def load_baselines(path):
+    """
+    Given the path of a baselines file, return the baselines recorded for the
+    current environment, or an empty dictionary
+    """
+    try:
+        with open(path) as baselines_file:
+            baselines = json.load(baselines_file)
+    except (IOError, ValueError):
+        return {}
+    return baselines.get(get_environment(), {})
+
+
+def save_baselines(path, results):
+    """
+    Given the path of a baselines file and results, store the results as the
+    baselines of the current environment, keeping those of others
+    """
+    try:
+        with open(path) as baselines_file:
+            baselines = json.load(baselines_file)
+    except (IOError, ValueError):
+        baselines = {}
+    baselines[get_environment()] = results
+    with open(path, 'w') as baselines_file:
+        json.dump(baselines, baselines_file, indent=4, sort_keys=True)
+
+
+class WideObject(object):
+    """An object with hundreds of attributes, methods and properties"""
+
+    def method(self):
+        return self
+
+    def method_with_args(self, arg):
+        return arg
+
+    @property
+    def prop(self):
+        return self.method()
+
+
+def make_wide_object(attributes=ATTRIBUTES):
+    obj = WideObject()
+    for index in range(attributes):
+        setattr(obj, 'attribute_{0}'.format(index), index)
+    return obj
+
+
+def make_user(groups=GROUPS, permissions=PERMISSIONS):
+    """
+    Create a user in the database with many groups and permissions, whose
+    attributes include foreign keys and many to many relations
+    """
+    user = User.objects.create_user('benchmark', 'benchmark@example.com',
+                                    'benchmark')
+    all_permissions = list(Permission.objects.all()[:permissions])
+    user.user_permissions.add(*all_permissions)
+    for index in range(groups):
+        group = Group.objects.create(name='group {0}'.format(index))
+        group.permissions.add(*all_permissions[:index])
+        user.groups.add(group)
+    return User.objects.get(pk=user.pk)
+
+
+def make_context(layers=LAYERS, variables=VARIABLES_PER_LAYER):
+    """Return a context with many layers of variables, some shadowed"""
+    context = Context()
+    for layer in range(layers):
+        # Half of the names are shared by every layer
+        context.update(dict(
+            ('var_{0}_{1}'.format(layer if index % 2 else 0, index), index)
+            for index in range(variables)))
+    return context
+
+
+def make_nested(depth=4, width=4):
+    """Return lists nested `depth` levels deep, as found in flattened data"""
+    nested = list(range(width))
+    for x in range(depth):
+        nested = [nested, 'text'] * width
+    return nested
+
+
+def get_benchmarks():
+    """Return a list of Benchmarks, creating their inputs"""
+    user = make_user()
+    obj = make_wide_object()
+    context = make_context()
+    nested = make_nested()
+    tag_context = Context({'user': user, 'obj': obj})
+    for layer in context.dicts[1:]:
+        tag_context.update(layer)
+
+    def render(source):
+        template = Template('{% load debug_tags %}' + source)
+        return lambda: template.render(tag_context)
+
+    return [
+        Benchmark('_flatten', lambda: list(_flatten(nested))),
+        Benchmark('get_variables', lambda: get_variables(context)),
+        Benchmark('get_variable_index', lambda: get_variable_index(context)),
+        Benchmark('get_attributes wide object',
+                  lambda: get_attributes(obj)),
+        Benchmark('get_attributes user', lambda: get_attributes(user)),
+        Benchmark('get_details wide object', lambda: get_details(obj)),
+        Benchmark('get_details user', lambda: get_details(user)),
+        Benchmark('get_details user unevaluated',
+                  lambda: get_details(user, evaluate=False)),
+        Benchmark('{% variables %}', render('{% variables %}')),
+        Benchmark('{% attributes obj %}', render('{% attributes obj %}')),
+        Benchmark('{% details obj %}', render('{% details obj %}')),
+        Benchmark('{% details user %}', render('{% details user %}')),
+    ]
+
+
+def run_benchmarks(names=None, min_time=MIN_TIME, repeat=REPEAT):
+    """
+    Run the benchmarks, or only those whose name contains one of `names`, and
+    return a dictionary of their results by name. Tag output is kept in memory
+    rather than printed, and the settings are restored afterwards. Expects a
+    test database to be set up.
+    """
+    template_debug = settings.TEMPLATE_DEBUG
+    settings.TEMPLATE_DEBUG = True
+    results = {}
+    try:
+        with use_memory_sink(size=1):
+            for benchmark in get_benchmarks():
+                if names and not any(name in benchmark.name
+                                     for name in names):
+                    continue
+                results[benchmark.name] = benchmark.run(min_time, repeat)
+    finally:
+        settings.TEMPLATE_DEBUG = template_debug
+    return results
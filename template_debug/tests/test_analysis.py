@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+
+from template_debug.tests.base import TemplateDebugTestCase
+from template_debug.analysis import (AnalysisCache, analyze_template,
+    analyze_templates, compile_template, find_templates, get_lookups)
+
+
+def get_depths(source):
+    "Return a list of (lookup, depth) tuples made by a template source."
+    return [(lookup['lookup'], lookup['depth'])
+            for lookup in get_lookups(compile_template(source, 'test'))]
+
+
+class GetLookupsTestCase(TemplateDebugTestCase):
+
+    def test_loop_depth(self):
+        "Assure lookups in loop bodies are nested one level deeper"
+        depths = get_depths(
+            '{% for order in orders %}{% for item in order.items %}'
+            '{{ item.product.name }}{% endfor %}{% empty %}{{ none }}'
+            '{% endfor %}'
+        )
+        self.assertEqual(depths, [('orders', 0), ('order.items', 1),
+                                  ('item.product.name', 2), ('none', 0)])
+
+    def test_tag_arguments(self):
+        "Assure lookups in conditions, filters and tag arguments are found"
+        depths = get_depths(
+            '{% if a.b and not c %}{{ d|default:e.f }}{% endif %}'
+            '{% with g=h.i %}{% endwith %}{{ 1 }}{{ "text" }}'
+        )
+        self.assertEqual(sorted(lookup for lookup, depth in depths),
+                         ['a.b', 'c', 'd', 'e.f', 'h.i'])
+
+    def test_line_numbers(self):
+        lookups = get_lookups(compile_template('a\n\n{{ b }}', 'test'))
+        self.assertEqual(lookups[0]['line'], 3)
+
+
+class AnalyzeTemplatesTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.templates = []
+        for name, source in (
+                ('debug.html', '{% load debug_tags %}{% variables %}{{ a }}'),
+                ('broken.html', '{% if %}'),
+                ('plain.html', '{{ b.c }}')):
+            path = os.path.join(self.directory, name)
+            with open(path, 'w') as template_file:
+                template_file.write(source)
+            self.templates.append((name, path))
+        self.cache_path = os.path.join(self.directory, 'cache.json')
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def test_analyze_template(self):
+        debug, broken, plain = [analyze_template(template)
+                                for template in self.templates]
+        self.assertEqual(debug['debug_tags'], ['load', 'variables'])
+        self.assertEqual([lookup['lookup'] for lookup in debug['lookups']],
+                         ['a'])
+        self.assertTrue(broken['error'].startswith('TemplateSyntaxError'))
+        self.assertEqual(plain['error'], None)
+
+    def test_parallel(self):
+        index = analyze_templates(self.templates, processes=2)
+        self.assertEqual([result['name'] for result in index],
+                         ['debug.html', 'broken.html', 'plain.html'])
+
+    def test_cache(self):
+        "Assure only templates changed since the last run are parsed again"
+        analyze_templates(self.templates, 1, AnalysisCache(self.cache_path))
+        with open(self.cache_path) as cache_file:
+            data = json.load(cache_file)
+        # Mark the cached results so reuse can be told from parsing again
+        for entry in data['entries'].values():
+            entry['result']['error'] = 'cached'
+        data['entries'][self.templates[2][1]]['mtime'] -= 1
+        with open(self.cache_path, 'w') as cache_file:
+            json.dump(data, cache_file)
+        index = analyze_templates(self.templates, 1,
+                                  AnalysisCache(self.cache_path))
+        self.assertEqual([result['error'] for result in index],
+                         ['cached', 'cached', None])
+
+    def test_find_templates(self):
+        names = [name for name, path in find_templates()]
+        self.assertTrue('home.html' in names)
+        self.assertTrue('template_debug/request_list.html' in names)
@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+from django.conf import settings
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.tests.benchmarks import (Benchmark, compare,
+    load_baselines, run_benchmarks, save_baselines)
+
+
+class BenchmarkTestCase(TemplateDebugTestCase):
+
+    def test_run(self):
+        calls = []
+        result = Benchmark('append', lambda: calls.append(1)).run(
+            min_time=0.001, repeat=1)
+        self.assertTrue(result['ops'] > 0)
+        self.assertTrue(calls)
+
+    def test_restores_settings(self):
+        settings.TEMPLATE_DEBUG = False
+        try:
+            with use_memory_sink():
+                self.assertEqual(run_benchmarks(names=['no such benchmark']),
+                                 {})
+                self.assertFalse(settings.TEMPLATE_DEBUG)
+                self.assertEqual(settings.TEMPLATE_DEBUG_SINK['BACKEND'],
+                                 'template_debug.sinks.MemorySink')
+                self.assertEqual(settings.TEMPLATE_DEBUG_SINK['OPTIONS'], {})
+        finally:
+            settings.TEMPLATE_DEBUG = True
+
+    def test_compare(self):
+        baselines = {
+            'a': {'ops': 100.0, 'peak_bytes': 1000},
+            'b': {'ops': 100.0, 'peak_bytes': None},
+        }
+        results = {
+            'a': {'ops': 70.0, 'peak_bytes': 1100},
+            'b': {'ops': 90.0, 'peak_bytes': 5000},
+            'c': {'ops': 1.0, 'peak_bytes': 1},
+        }
+        self.assertEqual(compare(results, baselines, threshold=0.2),
+                         [('a', 'ops', 100.0, 70.0)])
+        self.assertEqual(len(compare(results, baselines, threshold=0.05)), 3)
+
+    def test_baselines(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            self.assertEqual(load_baselines(path), {})
+            results = {'a': {'ops': 1.0, 'peak_bytes': None}}
+            save_baselines(path, results)
+            self.assertEqual(load_baselines(path), results)
+        finally:
+            os.remove(path)
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test.client import RequestFactory
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.collector import (CollectorSink, RequestStore,
+    finish_request, get_current, get_store, start_request)
+from template_debug.middleware import CollectorMiddleware
+from template_debug.sinks import Record
+
+
+class RequestStoreTestCase(TemplateDebugTestCase):
+
+    def test_keeps_recent_requests(self):
+        store = RequestStore(size=2)
+        requests = [start_request('/{0}/'.format(x), 'GET') for x in range(3)]
+        finish_request(store=False)
+        for request_records in requests:
+            store.add(request_records)
+        self.assertEqual(store.requests(), requests[:0:-1])
+        self.assertEqual(store.get(requests[0].id), None)
+
+
+class CollectorSinkTestCase(TemplateDebugTestCase):
+
+    def test_collects_for_current_request(self):
+        sink = CollectorSink()
+        sink.emit(Record('dropped', 1))
+        request_records = start_request('/', 'GET')
+        self.assertTrue(get_current() is request_records)
+        sink.emit(Record('tag', 2))
+        self.assertTrue(finish_request(store=False) is request_records)
+        self.assertEqual(get_current(), None)
+        self.assertEqual([record.data for record in request_records.records],
+                         [2])
+
+
+class CollectorMiddlewareTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        settings.TEMPLATE_DEBUG = True
+        self.collector_sink = use_memory_sink(
+            'template_debug.collector.CollectorSink')
+        self.collector_sink.__enter__()
+        get_store().clear()
+
+    def tearDown(self):
+        settings.TEMPLATE_DEBUG = True
+        self.collector_sink.__exit__(None, None, None)
+
+    def test_collects_request(self):
+        middleware = CollectorMiddleware()
+        request = RequestFactory().get('/collected/')
+        middleware.process_request(request)
+        Template('{% load debug_tags %}{% details a %}').render(
+            Context({'a': list(Permission.objects.all()[:1])}))
+        middleware.process_response(request, HttpResponse())
+        request_records, = get_store().requests()
+        self.assertEqual(request_records.path, '/collected/')
+        self.assertEqual(request_records.status_code, 200)
+        self.assertEqual(request_records.query_count, 1)
+        self.assertEqual([record.tag for record in request_records.records],
+                         ['details'])
+
+    def login_staff(self):
+        user = self.create_user(username='staff', password='password')
+        user.is_staff = True
+        user.save()
+        self.client.login(username='staff', password='password')
+
+    def test_views(self):
+        self.login_staff()
+        request_records = start_request('/viewed/', 'GET')
+        Template('{% load debug_tags %}{% variables %}').render(
+            Context({'shown_variable': 1}))
+        finish_request()
+        response = self.client.get('/template_debug/')
+        self.assertContains(response, '/viewed/')
+        response = self.client.get(
+            '/template_debug/{0}/'.format(request_records.id))
+        self.assertContains(response, 'shown_variable')
+        self.assertEqual(
+            self.client.get('/template_debug/0/').status_code, 404)
+
+    def test_views_disabled(self):
+        self.login_staff()
+        settings.TEMPLATE_DEBUG = False
+        self.assertEqual(self.client.get('/template_debug/').status_code, 404)
+
+    def test_views_forbidden(self):
+        "Assure only staff and INTERNAL_IPS see the output of the tags"
+        self.assertEqual(self.client.get('/template_debug/').status_code, 403)
+        self.create_user(username='alice', password='password')
+        self.client.login(username='alice', password='password')
+        self.assertEqual(self.client.get('/template_debug/').status_code, 403)
+        with self.settings(INTERNAL_IPS=('127.0.0.1',)):
+            self.assertEqual(self.client.get('/template_debug/').status_code,
+                             200)
@@ -0,0 +1,70 @@
+import socket
+from threading import Event
+
+from template_debug.tests.base import TemplateDebugTestCase
+from template_debug.debugger import DebuggerProbe
+
+
+class FakeSocket(object):
+
+    def close(self):
+        pass
+
+
+class DebuggerProbeTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.connects = 0
+        self.listening = False
+
+    def connect(self, address, timeout):
+        self.connects += 1
+        if not self.listening:
+            raise socket.error('Connection refused')
+        return FakeSocket()
+
+    def get_probe(self, connect=None):
+        return DebuggerProbe(timeout=1, retry_after=30,
+                             clock=lambda: self.now,
+                             connect=connect or self.connect)
+
+    def test_available(self):
+        self.listening = True
+        probe = self.get_probe()
+        self.assertTrue(probe.is_available())
+        self.assertTrue(probe.is_available())
+        self.assertEqual(self.connects, 1)
+
+    def test_failure_expires(self):
+        probe = self.get_probe()
+        self.assertFalse(probe.is_available())
+        self.listening = True
+        self.now = 29
+        self.assertFalse(probe.is_available())
+        self.assertEqual(self.connects, 1)
+        self.now = 30
+        self.assertTrue(probe.is_available())
+        self.assertEqual(self.connects, 2)
+
+    def test_mark_failed(self):
+        self.listening = True
+        probe = self.get_probe()
+        probe.is_available()
+        probe.mark_failed()
+        self.assertFalse(probe.is_available())
+
+    def test_does_not_wait_for_slow_probe(self):
+        "Assure a slow probe finishes in the background"
+        release = Event()
+
+        def slow_connect(address, timeout):
+            release.wait(5)
+            return FakeSocket()
+        probe = self.get_probe(slow_connect)
+        probe.timeout = 0.01
+        self.assertFalse(probe.is_available())
+        thread = probe._probe
+        release.set()
+        thread.join(5)
+        self.assertTrue(probe.is_available())
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.template import Context, Template
+
+from template_debug.tests.base import TemplateDebugTestCase
+from template_debug.loaders import (ProfilingLoader, StrippingLoader,
+    iter_nodes, strip_debug_tags, stripped_templates)
+from template_debug.profiling import node_stats
+
+
+APP_LOADERS = ('django.template.loaders.app_directories.Loader', )
+
+
+def make_loader(loader_class, loaders):
+    "Instantiate a loader the way the installed version of Django would."
+    try:
+        from django.template.engine import Engine
+    except ImportError:
+        # Django < 1.8
+        return loader_class(loaders)
+    return loader_class(Engine.get_default(), loaders)
+
+
+class IterNodesTestCase(TemplateDebugTestCase):
+
+    def test_nested_nodes(self):
+        template = Template(
+            '{% for x in y %}{% if x %}a{% else %}{{ x }}{% endif %}'
+            '{% endfor %}'
+        )
+        names = [node.__class__.__name__
+                 for node in iter_nodes(template.nodelist)]
+        self.assertEqual(names[:2], ['ForNode', 'IfNode'])
+        self.assertEqual(len(names), 4)
+
+
+class ProfilingLoaderTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        node_stats.clear()
+        settings.TEMPLATE_DEBUG = True
+
+    def tearDown(self):
+        if hasattr(settings, 'TEMPLATE_DEBUG_PROFILE'):
+            del settings.TEMPLATE_DEBUG_PROFILE
+
+    def test_records_nodes_by_line(self):
+        loader = make_loader(ProfilingLoader, APP_LOADERS)
+        template, origin = loader.load_template('home.html')
+        rendered = template.render(Context())
+        self.assertTrue('<p>test</p>' in rendered)
+        keys = [key for key, stat in node_stats.report()]
+        self.assertTrue('home.html:9 BlockNode' in keys)
+        self.assertEqual(node_stats.get('home.html:9 BlockNode')['count'], 1)
+
+    def test_instruments_once(self):
+        "Assure cached templates are not instrumented twice"
+        loader = make_loader(ProfilingLoader, [
+            ('django.template.loaders.cached.Loader', APP_LOADERS),
+        ])
+        for x in range(2):
+            template, origin = loader.load_template('home.html')
+            template.render(Context())
+        self.assertEqual(node_stats.get('home.html:9 BlockNode')['count'], 2)
+
+    def test_nodes_without_position(self):
+        "Assure nested nodes of the same class are keyed apart"
+        template = Template('{% if a %}{% if b %}x{% endif %}{% endif %}')
+        # Nodes carry no position when compiled with TEMPLATE_DEBUG off
+        for node in iter_nodes(template.nodelist):
+            node.__dict__.pop('source', None)
+        make_loader(ProfilingLoader, APP_LOADERS).process_template(
+            template, 'nested.html')
+        template.render(Context({'a': True, 'b': True}))
+        self.assertEqual(sorted(key for key, stat in node_stats.report()),
+                         ['nested.html:#0 IfNode', 'nested.html:#1 IfNode',
+                          'nested.html:#2 TextNode'])
+
+    def test_disabled(self):
+        settings.TEMPLATE_DEBUG_PROFILE = False
+        loader = make_loader(ProfilingLoader, APP_LOADERS)
+        template, origin = loader.load_template('home.html')
+        template.render(Context())
+        self.assertEqual(node_stats.report(), [])
+
+
+class StripDebugTagsTestCase(TemplateDebugTestCase):
+
+    def test_strips_tags(self):
+        source, removed = strip_debug_tags(
+            '{% load debug_tags %}\n{% variables %}{% profile "a" %}'
+            '{{ x }}{% endprofile %}'
+        )
+        self.assertEqual(source, '\n{{ x }}')
+        self.assertEqual(removed,
+                         ['load', 'variables', 'profile', 'endprofile'])
+
+    def test_keeps_other_libraries(self):
+        source, removed = strip_debug_tags(
+            '{% load i18n debug_tags %}{% trans "a" %}{% details x %}')
+        self.assertEqual(source, '{% load i18n %}{% trans "a" %}')
+
+    def test_load_from(self):
+        source, removed = strip_debug_tags(
+            '{% load variables from debug_tags %}{% variables %}'
+            '{% details x %}')
+        self.assertEqual(source, '{% details x %}')
+
+    def test_requires_load(self):
+        "Assure tags with the same name from other libraries are kept"
+        self.assertEqual(strip_debug_tags('{% variables %}'),
+                         ('{% variables %}', []))
+        template = '{% variables %}{% load debug_tags %}'
+        self.assertEqual(strip_debug_tags(template)[0], '{% variables %}')
+
+    def test_verbatim(self):
+        template = ('{% load debug_tags %}{% verbatim %}{% variables %}'
+                    '{% endverbatim %}')
+        self.assertEqual(strip_debug_tags(template)[0],
+                         '{% verbatim %}{% variables %}{% endverbatim %}')
+
+
+class StrippingLoaderTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        stripped_templates.clear()
+
+    def test_strips_before_compiling(self):
+        loader = make_loader(StrippingLoader, APP_LOADERS)
+        template, origin = loader.load_template('home.html')
+        self.assertEqual(stripped_templates, {'home.html': ['load']})
+        self.assertTrue('<p>test</p>' in template.render(Context()))
+        names = [node.__class__.__name__
+                 for node in iter_nodes(template.nodelist)]
+        self.assertFalse('LoadNode' in names)
@@ -0,0 +1,80 @@
+import gc
+import sys
+
+from django.conf import settings
+from django.template import Context, Template
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug import memory
+from template_debug.memory import deep_size, get_context_memory
+
+
+class DeepSizeTestCase(TemplateDebugTestCase):
+
+    def test_counts_referenced_objects(self):
+        "Assure the items of containers are included"
+        items = [object() for x in range(10)]
+        size, objects, complete = deep_size(items)
+        self.assertEqual(objects, 11)
+        self.assertEqual(size, sys.getsizeof(items, 0) +
+                         10 * sys.getsizeof(items[0], 0))
+        self.assertTrue(complete)
+
+    def test_cycles(self):
+        "Assure objects that reference each other are counted once"
+        a = []
+        b = [a]
+        a.append(b)
+        self.assertEqual(deep_size(a)[1], 2)
+
+    def test_budget(self):
+        size, objects, complete = deep_size(list(range(1000, 2000)),
+                                            budget=10)
+        self.assertEqual(objects, 10)
+        self.assertFalse(complete)
+
+    def test_large_container_not_listed(self):
+        "Assure the items of a large container are not all listed"
+        listed = []
+
+        class RecordingGC(object):
+            def get_referents(self, obj):
+                listed.append(obj)
+                return gc.get_referents(obj)
+        items = dict((x, [x]) for x in range(1000))
+        memory.gc = RecordingGC()
+        try:
+            size, objects, complete = deep_size(items, budget=10)
+        finally:
+            memory.gc = gc
+        self.assertEqual(objects, 10)
+        self.assertFalse(complete)
+        self.assertFalse(any(obj is items for obj in listed))
+
+    def test_skips_shared_objects(self):
+        "Assure classes, modules and functions are not counted"
+        self.assertEqual(deep_size([DeepSizeTestCase, sys, deep_size])[1], 1)
+
+
+class ContextMemoryTestCase(TemplateDebugTestCase):
+
+    def test_ranked_by_size(self):
+        context = Context({'small': 1, 'shadowed': 2})
+        context.update({'large': list(range(1000)), 'shadowed': 'a'})
+        rows = get_context_memory(context)
+        self.assertEqual([row['name'] for row in rows][0], 'large')
+        layers = dict((row['name'], row['layer']) for row in rows)
+        self.assertEqual(layers['small'], 1)
+        self.assertEqual(layers['shadowed'], 2)
+        self.assertFalse('True' in layers)
+
+    def test_tag(self):
+        settings.TEMPLATE_DEBUG = True
+        with use_memory_sink() as sink:
+            rendered = Template(
+                '{% load debug_tags %}{% context_memory limit=1 %}'
+            ).render(Context({'a': [1], 'b': list(range(100))}))
+        record, = sink.records()
+        self.assertEqual(rendered, '')
+        self.assertEqual([row['name'] for row in record.data], ['b'])
+        self.assertTrue(record.lines()[0].startswith('1. b: '))
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.template import Context, Template
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.nplusone import (LoopQueryDetector, track_nodes,
+    get_query_shape)
+
+
+class QueryShapeTestCase(TemplateDebugTestCase):
+
+    def test_in_placeholders(self):
+        self.assertEqual(
+            get_query_shape('SELECT a\n  FROM b WHERE c IN (%s, %s,%s)'),
+            'SELECT a FROM b WHERE c IN (...)'
+        )
+
+
+class LoopQueryDetectorTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        settings.TEMPLATE_DEBUG = True
+        self.permissions = list(Permission.objects.all()[:3])
+
+    def render(self, source, **kwargs):
+        template = Template(source)
+        track_nodes(template.nodelist)
+        with LoopQueryDetector() as detector:
+            template.render(Context(kwargs))
+        return detector
+
+    def test_repeated_in_loop(self):
+        detector = self.render(
+            '{% for p in permissions %}\n{{ p.content_type }}{% endfor %}',
+            permissions=self.permissions
+        )
+        row, = detector.repeated()
+        self.assertEqual(row['count'], 3)
+        self.assertTrue(row['loop'].endswith(':1 ForNode'))
+        self.assertTrue(':2 ' in row['node'])
+        self.assertTrue(row['node'].endswith('VariableNode'))
+        self.assertTrue('content_type' in row['sql'])
+
+    def test_single_query_not_repeated(self):
+        detector = self.render('{{ p.content_type }}',
+                               p=self.permissions[0])
+        self.assertEqual(detector.repeated(), [])
+        self.assertEqual(detector.report()[0]['count'], 1)
+
+    def test_loop_sequence_counts_once(self):
+        "Assure the query for a loop's own sequence is not counted in it"
+        detector = self.render(
+            '{% for p in permissions.all %}{{ p.codename }}{% endfor %}',
+            permissions=Permission.objects
+        )
+        self.assertEqual(detector.repeated(), [])
+        self.assertEqual(detector.report()[0]['loop'], None)
+
+
+class NPlusOneTagTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        settings.TEMPLATE_DEBUG = True
+        self.permissions = list(Permission.objects.all()[:3])
+        self.loop = Template(
+            '{% for p in permissions %}{{ p.content_type }}{% endfor %}')
+
+    def render(self, source, **kwargs):
+        kwargs['permissions'] = self.permissions
+        with use_memory_sink() as sink:
+            Template(source).render(Context(kwargs))
+        record, = sink.records()
+        return record.data
+
+    def test_include(self):
+        "Assure loops in included templates are tracked"
+        row, = self.render('{% load debug_tags %}{% nplusone %}'
+                           '{% include loop %}{% endnplusone %}',
+                           loop=self.loop)
+        self.assertEqual(row['count'], 3)
+        self.assertTrue(row['loop'].endswith('ForNode'))
+
+    def test_extends(self):
+        "Assure loops in blocks overriding the enclosed ones are tracked"
+        parent = Template('{% load debug_tags %}{% nplusone %}'
+                          '{% block content %}{% endblock %}{% endnplusone %}')
+        row, = self.render(
+            '{% extends parent %}{% block content %}'
+            '{% for p in permissions %}{{ p.content_type }}{% endfor %}'
+            '{% endblock %}', parent=parent)
+        self.assertEqual(row['count'], 3)
+        self.assertTrue(row['node'].endswith('VariableNode'))
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.template import Context, RequestContext, Template
+from django.test.client import RequestFactory
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.collector import finish_request, start_request
+from template_debug.processors import (instrument_processors,
+    processor_stats)
+
+try:
+    from django.template.engine import Engine
+except ImportError:
+    # Django < 1.8
+    Engine = None
+
+
+AUTH_PROCESSOR = 'django.contrib.auth.context_processors.auth'
+
+
+class InstrumentProcessorsTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        processor_stats.clear()
+        instrument_processors()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.create_user()
+
+    def tearDown(self):
+        # Configured processors are computed again when next needed
+        if Engine is not None:
+            del Engine.get_default().__dict__['template_context_processors']
+        else:
+            from django.template import context
+            context._standard_context_processors = None
+
+    def build(self):
+        "Render a RequestContext, which runs the context processors."
+        Template('').render(RequestContext(self.request))
+
+    def test_records_processors(self):
+        self.build()
+        rows = dict((row['name'], row) for row in processor_stats.report())
+        self.assertEqual(rows[AUTH_PROCESSOR]['count'], 1)
+        self.assertEqual(rows[AUTH_PROCESSOR]['variables'], ['perms', 'user'])
+        self.assertEqual(rows[AUTH_PROCESSOR]['queries'], 0)
+
+    def test_instruments_once(self):
+        instrument_processors()
+        self.build()
+        rows = dict((row['name'], row) for row in processor_stats.report())
+        self.assertEqual(rows[AUTH_PROCESSOR]['count'], 1)
+
+    def test_collected(self):
+        request_records = start_request('/', 'GET')
+        self.build()
+        finish_request(store=False)
+        names = [processor['name']
+                 for processor in request_records.processors]
+        self.assertTrue(AUTH_PROCESSOR in names)
+
+    def test_unused_variables(self):
+        "Assure the processors layer is split by the processor of each name"
+        settings.TEMPLATE_DEBUG = True
+        with use_memory_sink() as sink:
+            Template('{% load debug_tags %}{% unused_variables %}{{ user }}'
+                     '{{ title }}{% endunused_variables %}').render(
+                RequestContext(self.request, {'title': 'Home'}))
+        record, = sink.records()
+        self.assertEqual(record.data['layer 1'], [])
+        self.assertEqual(record.data['context processor ' + AUTH_PROCESSOR],
+                         ['perms'])
+
+    def test_tag(self):
+        settings.TEMPLATE_DEBUG = True
+        with use_memory_sink() as sink:
+            self.build()
+            Template('{% load debug_tags %}{% processors %}').render(
+                Context())
+        record, = sink.records()
+        self.assertTrue(any(line.startswith(AUTH_PROCESSOR + ': 1 calls')
+                            for line in record.lines()))
@@ -0,0 +1,137 @@
+from django.template import Context, Template
+from django.template.base import Variable
+
+from template_debug.tests.base import TemplateDebugTestCase
+from template_debug.profiling import (Stat, StatsTable, RingBuffer, Sampler,
+    get_sampler, start_request, finish_request, is_recording, record,
+    ResolutionCounter)
+
+
+class StatTestCase(TemplateDebugTestCase):
+
+    def test_aggregates(self):
+        stat = Stat()
+        for duration in range(1, 101):
+            stat.add(duration)
+        self.assertEqual(stat.as_dict(), {
+            'count': 100, 'total': 5050, 'p50': 50, 'p95': 95, 'max': 100
+        })
+
+    def test_samples_bounded(self):
+        stat = Stat(sample_size=10)
+        for duration in range(100):
+            stat.add(duration)
+        self.assertEqual(len(stat.samples), 10)
+        self.assertEqual(stat.count, 100)
+        self.assertEqual(stat.percentile(50), 94)
+
+    def test_empty(self):
+        self.assertEqual(Stat().percentile(95), 0)
+
+
+class StatsTableTestCase(TemplateDebugTestCase):
+
+    def test_report_sorted_by_total(self):
+        table = StatsTable()
+        table.add('fast', 1)
+        table.add('slow', 10)
+        table.add('fast', 2)
+        self.assertEqual([key for key, row in table.report()],
+                         ['slow', 'fast'])
+        self.assertEqual(table.get('fast')['count'], 2)
+        self.assertEqual(table.get('missing'), None)
+
+
+class RingBufferTestCase(TemplateDebugTestCase):
+
+    def test_keeps_most_recent(self):
+        buffer = RingBuffer(3)
+        for item in range(5):
+            buffer.append(item)
+        self.assertEqual(buffer.items(), [2, 3, 4])
+        self.assertEqual(len(buffer), 3)
+
+
+class SamplerTestCase(TemplateDebugTestCase):
+
+    def test_rate(self):
+        values = iter([0.05, 0.5, 0.09, 0.95])
+        sampler = Sampler(rate=10, random=lambda: next(values))
+        self.assertEqual([sampler.should_sample('/') for x in range(4)],
+                         [True, False, True, False])
+
+    def test_path_interval(self):
+        now = [100]
+        sampler = Sampler(path_interval=60, clock=lambda: now[0])
+        self.assertTrue(sampler.should_sample('/a/'))
+        self.assertFalse(sampler.should_sample('/a/'))
+        self.assertTrue(sampler.should_sample('/b/'))
+        now[0] += 60
+        self.assertTrue(sampler.should_sample('/a/'))
+
+
+class SampledRequestTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        self.sampler = get_sampler()
+        self.sampler.samples.clear()
+        self.table = StatsTable()
+
+    def tearDown(self):
+        self.sampler.rate = 1
+
+    def test_sampled_request(self):
+        self.assertTrue(start_request('/a/'))
+        self.assertTrue(is_recording())
+        record(self.table, 'key', 5)
+        record(self.table, 'key', 7)
+        finish_request()
+        sample, = self.sampler.samples.items()
+        self.assertEqual(sample.path, '/a/')
+        self.assertEqual(sample.timings, {'key': 12})
+        self.assertEqual(self.table.get('key')['count'], 2)
+
+    def test_unsampled_request(self):
+        self.sampler.rate = 2
+        self.sampler._random = lambda: 0.9
+        self.assertFalse(start_request('/a/'))
+        self.assertFalse(is_recording())
+        record(self.table, 'key', 5)
+        finish_request()
+        self.assertEqual(self.table.get('key'), None)
+        self.assertEqual(self.sampler.samples.items(), [])
+        self.assertTrue(is_recording())
+
+
+class ResolutionCounterTestCase(TemplateDebugTestCase):
+
+    def test_counts_lookup_chains(self):
+        template = Template(
+            '{% for item in items %}{{ item.name }}{{ item.name|upper }}'
+            '{{ 1 }}{% endfor %}'
+        )
+        items = [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]
+        with ResolutionCounter() as counter:
+            rendered = template.render(Context({'items': items}))
+        self.assertEqual(rendered, 'aA1bB1cC1')
+        self.assertEqual(counter.counts['item.name'], 6)
+        self.assertEqual(counter.counts['item.name|upper'], 3)
+        self.assertEqual(counter.counts['items'], 1)
+        self.assertFalse('1' in counter.counts)
+        totals = [total for key, count, total in counter.report()]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+
+    def test_restores_resolve(self):
+        resolve = Variable.resolve
+        with ResolutionCounter():
+            with ResolutionCounter():
+                pass
+            self.assertNotEqual(Variable.resolve, resolve)
+        self.assertEqual(Variable.resolve, resolve)
+
+    def test_only_counts_inside_block(self):
+        template = Template('{{ a }}')
+        with ResolutionCounter() as counter:
+            pass
+        template.render(Context({'a': 1}))
+        self.assertEqual(counter.counts, {})
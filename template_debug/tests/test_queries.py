@@ -0,0 +1,36 @@
+from django.contrib.auth.models import Permission
+
+from template_debug.tests.base import TemplateDebugTestCase
+from template_debug.queries import QueryCounter, QueryNotAllowed
+
+
+class QueryCounterTestCase(TemplateDebugTestCase):
+
+    def test_counts_queries(self):
+        with QueryCounter() as counter:
+            list(Permission.objects.all())
+            Permission.objects.count()
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(len(counter.queries), 2)
+        self.assertTrue(counter.time >= 0)
+
+    def test_stops_counting_on_exit(self):
+        with QueryCounter() as counter:
+            pass
+        Permission.objects.count()
+        self.assertEqual(counter.count, 0)
+
+    def test_strict(self):
+        with QueryCounter(strict=True) as counter:
+            self.assertRaises(QueryNotAllowed, Permission.objects.count)
+        self.assertEqual(counter.count, 0)
+        # Queries are allowed again once the block exits
+        Permission.objects.count()
+
+    def test_nested(self):
+        with QueryCounter() as outer:
+            with QueryCounter() as inner:
+                Permission.objects.count()
+            Permission.objects.count()
+        self.assertEqual(inner.count, 1)
+        self.assertEqual(outer.count, 2)
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.template import Context
+from django.template.loader import get_template
+from django.test.utils import override_settings
+
+from template_debug.tests.base import TemplateDebugTestCase
+from template_debug.render_tree import RenderNode, format_tree, recent_trees
+
+
+TREE_LOADERS = (
+    ('template_debug.loaders.RenderTreeLoader', (
+        ('django.template.loaders.cached.Loader', (
+            'django.template.loaders.app_directories.Loader',
+        )),
+    )),
+)
+
+
+class RenderNodeTestCase(TemplateDebugTestCase):
+
+    def test_exclusive(self):
+        root = RenderNode('template', 'a.html')
+        root.duration = 10
+        for duration in (2, 3):
+            child = RenderNode('block', 'content')
+            child.duration = duration
+            root.children.append(child)
+        self.assertEqual(root.exclusive, 5)
+        self.assertEqual([depth for depth, node in root.walk()], [0, 1, 1])
+
+    def test_format_tree(self):
+        root = RenderNode('template', 'a.html', 1500000, False)
+        root.duration = 2000000
+        root.children.append(RenderNode('block', 'content'))
+        self.assertEqual(format_tree(root), [
+            'template a.html: 2.000 ms, 2.000 ms self, loaded in 1.500 ms '
+            '(cache miss)',
+            '  block content: 0.000 ms, 0.000 ms self',
+        ])
+
+
+class RenderTreeLoaderTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        recent_trees.clear()
+        settings.TEMPLATE_DEBUG = True
+        # Each test starts with an empty template cache
+        self.loaders = override_settings(TEMPLATE_LOADERS=TREE_LOADERS)
+        self.loaders.enable()
+
+    def tearDown(self):
+        self.loaders.disable()
+        if hasattr(settings, 'TEMPLATE_DEBUG_PROFILE'):
+            del settings.TEMPLATE_DEBUG_PROFILE
+
+    def render(self):
+        get_template('a.html').render(Context())
+        return recent_trees.items()[-1]
+
+    def test_records_tree(self):
+        root = self.render()
+        nodes = [(depth, node.kind, node.name, node.cached)
+                 for depth, node in root.walk()]
+        self.assertEqual(nodes, [
+            (0, 'template', 'a.html', False),
+            (1, 'extends', 'home.html', False),
+            (2, 'block', 'content', None),
+        ])
+        self.assertTrue(root.load_time > 0)
+        self.assertTrue(root.duration >= root.children[0].duration)
+
+    def test_cache_hits(self):
+        self.render()
+        root = self.render()
+        self.assertEqual([node.cached for depth, node in root.walk()],
+                         [True, True, None])
+        self.assertEqual(len(recent_trees), 2)
+
+    def test_disabled(self):
+        settings.TEMPLATE_DEBUG_PROFILE = False
+        get_template('a.html').render(Context())
+        self.assertEqual(recent_trees.items(), [])
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import tempfile
+from threading import Event
+
+from django.conf import settings
+from django.template import Context, Template
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.sinks import (Record, LoggingSink, JSONLinesSink,
+    MemorySink, BufferedSink, get_sink)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class RecordTestCase(TemplateDebugTestCase):
+
+    def test_lines(self):
+        self.assertEqual(Record('tag', [1, 2]).lines(), [[1, 2]])
+        record = Record('tag', [1, 2], lambda data: [str(x) for x in data])
+        self.assertEqual(record.lines(), ['1', '2'])
+
+
+class LoggingSinkTestCase(TemplateDebugTestCase):
+
+    def test_logs_lines(self):
+        handler = ListHandler()
+        logger = logging.getLogger('template_debug.tests')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            LoggingSink('template_debug.tests').emit(
+                Record('tag', 'data', lambda data: ['a', 'b']))
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(handler.messages, ["'a'\n'b'"])
+
+
+class JSONLinesSinkTestCase(TemplateDebugTestCase):
+
+    def test_writes_lines(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            sink = JSONLinesSink(path)
+            sink.emit(Record('attributes', ['a', 'b']))
+            sink.emit_batch([Record('details', {'a': object()})])
+            with open(path) as output:
+                records = [json.loads(line) for line in output]
+        finally:
+            os.remove(path)
+        self.assertEqual(records[0]['tag'], 'attributes')
+        self.assertEqual(records[0]['data'], ['a', 'b'])
+        self.assertTrue(records[1]['data']['a'].startswith('<object'))
+
+
+class BufferedSinkTestCase(TemplateDebugTestCase):
+
+    def test_writes_in_background(self):
+        memory = MemorySink()
+        sink = BufferedSink(memory, batch_size=2)
+        for x in range(5):
+            sink.emit(Record('tag', x))
+        sink.flush()
+        self.assertEqual([record.data for record in memory.records()],
+                         list(range(5)))
+
+    def test_drops_when_full(self):
+        memory = MemorySink(size=1000)
+        sink = BufferedSink(memory, queue_size=1)
+        # Fill the queue faster than it can be emptied
+        for x in range(1000):
+            sink.emit(Record('tag', x))
+        sink.flush()
+        self.assertEqual(len(memory.records()) + sink.dropped, 1000)
+
+    def test_flush_timeout(self):
+        "Assure a stuck sink does not block a flush with a timeout"
+        release = Event()
+        memory = MemorySink()
+        memory.emit_batch = lambda records: release.wait(5)
+        sink = BufferedSink(memory)
+        sink.emit(Record('tag', 1))
+        try:
+            self.assertFalse(sink.flush(timeout=0.01))
+        finally:
+            release.set()
+        self.assertTrue(sink.flush(timeout=5))
+
+
+class ListHolder(object):
+
+    def __init__(self):
+        self.items = list(range(100))
+
+
+class ConfiguredSinkTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        settings.TEMPLATE_DEBUG = True
+        self.memory_sink = use_memory_sink(size=10)
+        self.memory_sink.__enter__()
+
+    def tearDown(self):
+        self.memory_sink.__exit__(None, None, None)
+
+    def test_tags_emit_records(self):
+        Template('{% load debug_tags %}{% attributes a %}{% details a %}'
+                 ).render(Context({'a': 1}))
+        attributes, details = get_sink().records()
+        self.assertEqual(attributes.tag, 'attributes')
+        self.assertTrue('real' in attributes.data)
+        self.assertEqual(details.data['meta']['Class_name'], 'int')
+        self.assertEqual(details.lines()[-1], details.data['attributes'])
+
+    def test_details_shortened_when_read(self):
+        "Assure the details tag leaves bounding its values to the sink"
+        holder = ListHolder()
+        rendered = Template('{% load debug_tags %}{% details a %}').render(
+            Context({'a': holder}))
+        self.assertEqual(rendered, '')
+        details, = get_sink().records()
+        self.assertTrue(details._data['attributes']['items'] is holder.items)
+        self.assertTrue(details.data['attributes']['items'].endswith(
+            '(len=100)'))
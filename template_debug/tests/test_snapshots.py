@@ -0,0 +1,173 @@
+import os
+import shutil
+import stat
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management import call_command
+from django.template import Context, RequestContext, Template
+from django.test.client import RequestFactory
+from django.utils.six import StringIO
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.management.commands.open_snapshot import Command
+from template_debug.queries import QueryCounter
+from template_debug.snapshots import (capture, get_writer, read_snapshot,
+    write_snapshot)
+
+
+class CaptureTestCase(TemplateDebugTestCase):
+
+    def test_captures_variables(self):
+        user = self.create_user(username='alice')
+        snapshot = capture(Context({'user': user, 'items': list(range(50))}),
+                           'home.html', 3)
+        self.assertEqual(snapshot['template'], 'home.html')
+        self.assertEqual(snapshot['line'], 3)
+        self.assertEqual(snapshot['index']['user'], [1])
+        variable = snapshot['variables']['user']
+        self.assertEqual(variable['repr'], '<User: alice>')
+        self.assertEqual(variable['meta']['class_name'], 'User')
+        self.assertEqual(variable['attributes']['username'], "'alice'")
+        self.assertTrue(snapshot['variables']['items']['repr'].endswith(
+            '(len=50)'))
+
+    def test_no_queries(self):
+        "Assure querysets and models in the context are not evaluated"
+        permission = Permission.objects.get(codename='add_user')
+        context = Context({'permissions': Permission.objects.all(),
+                           'permission': permission})
+        with QueryCounter() as counter:
+            snapshot = capture(context, 'home.html', 1)
+        self.assertEqual(counter.count, 0)
+        variables = snapshot['variables']
+        self.assertEqual(variables['permissions']['repr'],
+                         '<QuerySet model=auth.Permission unevaluated>')
+        # The __str__ of a Permission reads its content type
+        self.assertEqual(variables['permission']['repr'], '<unevaluated repr>')
+
+    def test_lazy_user_not_loaded(self):
+        "Assure the user set by AuthenticationMiddleware is not loaded"
+        user = self.create_user(username='alice')
+        session = SessionStore()
+        session[SESSION_KEY] = user.pk
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session.save()
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session.session_key
+        SessionMiddleware().process_request(request)
+        AuthenticationMiddleware().process_request(request)
+        context = RequestContext(request, {'request': request,
+                                           'user': request.user})
+        with QueryCounter() as counter:
+            snapshot = capture(context, 'home.html', 1)
+        self.assertEqual(counter.count, 0)
+        self.assertTrue(snapshot['variables']['user']['meta']['unevaluated'])
+        self.assertEqual(request.user, user)
+
+
+class SnapshotFileTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        snapshot = capture(Context({'a': {'b': 1}}), 'home.html', 1)
+        path = os.path.join(self.directory, 'nested', 'snapshot.json.gz')
+        write_snapshot(snapshot, path)
+        self.assertEqual(read_snapshot(path)['variables']['a']['repr'],
+                         "{'b': 1}")
+
+    def test_private_files(self):
+        snapshot = capture(Context(), 'home.html', 1)
+        directory = os.path.join(self.directory, 'snapshots')
+        path = os.path.join(directory, 'snapshot.json.gz')
+        write_snapshot(snapshot, path)
+        self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode) & 0o077, 0)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_refuses_directory_of_another_user(self):
+        "N.B. Changing the owner of a directory requires root"
+        if not hasattr(os, 'geteuid') or os.geteuid() != 0:
+            return
+        os.chown(self.directory, os.getuid() + 1, -1)
+        path = os.path.join(self.directory, 'snapshot.json.gz')
+        self.assertRaises(IOError, write_snapshot,
+                          capture(Context(), 'home.html', 1), path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_tag(self):
+        settings.TEMPLATE_DEBUG = True
+        settings.TEMPLATE_DEBUG_SNAPSHOT_DIR = self.directory
+        try:
+            with use_memory_sink() as sink:
+                Template('{% load debug_tags %}\n{{ a }}{% snapshot %}'
+                         ).render(Context({'a': 'text'}))
+        finally:
+            del settings.TEMPLATE_DEBUG_SNAPSHOT_DIR
+        record, = sink.records()
+        get_writer().flush()
+        snapshot = read_snapshot(record.data)
+        self.assertEqual(snapshot['line'], 2)
+        self.assertEqual(snapshot['variables']['a']['repr'], "'text'")
+
+    def test_request_body_not_read(self):
+        "Assure the body of a request can still be read by the view"
+        settings.TEMPLATE_DEBUG = True
+        settings.TEMPLATE_DEBUG_SNAPSHOT_DIR = self.directory
+        request = RequestFactory().post('/', {'a': 'b'})
+        try:
+            with use_memory_sink() as sink:
+                Template('{% load debug_tags %}{% snapshot %}').render(
+                    Context({'request': request}))
+        finally:
+            del settings.TEMPLATE_DEBUG_SNAPSHOT_DIR
+        record, = sink.records()
+        get_writer().flush()
+        snapshot = read_snapshot(record.data)
+        attributes = snapshot['variables']['request']['attributes']
+        self.assertTrue('unevaluated request body' in attributes['POST'])
+        self.assertTrue(b'name="a"' in request.body)
+        self.assertEqual(request.POST['a'], 'b')
+
+    def test_disabled(self):
+        settings.TEMPLATE_DEBUG = False
+        try:
+            Template('{% load debug_tags %}{% snapshot %}').render(Context())
+        finally:
+            settings.TEMPLATE_DEBUG = True
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class OpenSnapshotTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        user = self.create_user(username='alice')
+        self.snapshot = capture(Context({'user': user}), 'home.html', 3)
+
+    def test_render(self):
+        namespace = Command().get_namespace(self.snapshot)
+        self.assertTrue('user' in namespace['availables'])
+        self.assertEqual(repr(namespace['user']), '<User: alice>')
+        self.assertEqual(namespace['render']('{{ user }} {{ user.username }}'),
+                         '&lt;User: alice&gt; &#39;alice&#39;')
+
+    def test_print(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'snapshot.json.gz')
+            write_snapshot(self.snapshot, path)
+            output = StringIO()
+            call_command('open_snapshot', path, shell=False, stdout=output)
+        finally:
+            shutil.rmtree(directory)
+        self.assertTrue(output.getvalue().startswith(
+            'Snapshot of home.html, line 3'))
@@ -1,7 +1,12 @@
 from django.conf import settings
+from django.template import Context, Template, TemplateSyntaxError
+from django.test.client import RequestFactory
 
-from template_debug.tests.base import TemplateDebugTestCase
-from template_debug.templatetags.debug_tags import require_template_debug
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.templatetags.debug_tags import (require_template_debug,
+    EMPTY_NODE, ContentNode, SnapshotNode)
+from template_debug.profiling import render_stats, get_sampler
+from template_debug.middleware import ProfilingMiddleware
 
 
 try:
@@ -25,3 +30,204 @@ class RequireTemplateDebugTestCase(TemplateDebugTestCase):
     def test_unchanged_if_template_debug_true(self):
         settings.TEMPLATE_DEBUG = True
         self.assertEqual(test_func(), 'test string')
+
+
+class ProfileTagTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        render_stats.clear()
+
+    def render(self, source, **kwargs):
+        return Template('{% load debug_tags %}' + source).render(
+            Context(kwargs))
+
+    def test_renders_content(self):
+        settings.TEMPLATE_DEBUG = True
+        rendered = self.render(
+            '{% profile "block" %}a{{ b }}c{% endprofile %}', b='b')
+        self.assertEqual(rendered, 'abc')
+
+    def test_records_block_and_children(self):
+        settings.TEMPLATE_DEBUG = True
+        for x in range(3):
+            self.render('{% profile "block" %}a{{ b }}{% endprofile %}')
+        stat = render_stats.get('block')
+        self.assertEqual(stat['count'], 3)
+        self.assertTrue(stat['max'] >= stat['p95'] >= stat['p50'] >= 0)
+        children = [key for key, row in render_stats.report()
+                    if key.startswith('block[')]
+        self.assertEqual(len(children), 2)
+
+    def test_nothing_recorded_if_template_debug_false(self):
+        settings.TEMPLATE_DEBUG = False
+        rendered = self.render('{% profile "block" %}a{% endprofile %}')
+        settings.TEMPLATE_DEBUG = True
+        self.assertEqual(rendered, 'a')
+        self.assertEqual(render_stats.get('block'), None)
+
+    def test_requires_label(self):
+        self.assertRaises(TemplateSyntaxError, Template,
+                          '{% load debug_tags %}{% profile %}{% endprofile %}')
+
+    def test_requires_literal_label(self):
+        "Assure labels can not vary between renders, adding keys each time"
+        settings.TEMPLATE_DEBUG = True
+        self.assertRaises(TemplateSyntaxError, Template,
+                          '{% load debug_tags %}{% profile obj.pk %}'
+                          '{% endprofile %}')
+        self.render("{% profile 'block' %}a{% endprofile %}")
+        self.assertEqual(render_stats.get('block')['count'], 1)
+
+
+class ProfilingMiddlewareTestCase(TemplateDebugTestCase):
+
+    def test_records_sample(self):
+        settings.TEMPLATE_DEBUG = True
+        sampler = get_sampler()
+        sampler.samples.clear()
+        middleware = ProfilingMiddleware()
+        request = RequestFactory().get('/sampled/')
+        middleware.process_request(request)
+        Template('{% load debug_tags %}{% profile "mw" %}a{% endprofile %}'
+                 ).render(Context())
+        middleware.process_response(request, None)
+        sample = sampler.samples.items()[-1]
+        self.assertEqual(sample.path, '/sampled/')
+        self.assertTrue('mw' in sample.timings)
+
+
+class ResolutionsTagTestCase(TemplateDebugTestCase):
+
+    def test_renders_content(self):
+        settings.TEMPLATE_DEBUG = True
+        with use_memory_sink() as sink:
+            rendered = Template(
+                '{% load debug_tags %}{% resolutions %}{{ a.b }}'
+                '{% endresolutions %}'
+            ).render(Context({'a': {'b': 'c'}}))
+        self.assertEqual(rendered, 'c')
+        record, = sink.records()
+        self.assertEqual(record.tag, 'resolutions')
+
+
+class AttributesTagTestCase(TemplateDebugTestCase):
+
+    def test_unevaluated_marked(self):
+        settings.TEMPLATE_DEBUG = True
+        with use_memory_sink() as sink:
+            Template('{% load debug_tags %}{% attributes a evaluate=False %}'
+                     ).render(Context({'a': UnevaluatedClass()}))
+        record, = sink.records()
+        self.assertEqual(set(record.data),
+                         set(['counted (unevaluated property)', 'method']))
+
+
+class UnevaluatedClass(object):
+
+    @property
+    def counted(self):
+        raise AssertionError('property was read')
+
+    def method(self):
+        return True
+
+
+class CompileIfTemplateDebugTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        # Django >= 1.8 reads TEMPLATE_DEBUG once, when the template engine is
+        # first used, so make sure that happens with it on.
+        settings.TEMPLATE_DEBUG = True
+        Template('')
+
+    def tearDown(self):
+        settings.TEMPLATE_DEBUG = True
+
+    def compile(self, source):
+        return Template('{% load debug_tags %}' + source)
+
+    def test_empty_node_if_template_debug_false(self):
+        settings.TEMPLATE_DEBUG = False
+        template = self.compile('{% details a.b %}{% variables %}')
+        self.assertEqual(list(template.nodelist)[1:], [EMPTY_NODE, EMPTY_NODE])
+        self.assertEqual(template.render(Context()), '')
+
+    def test_arguments_not_resolved(self):
+        "Assure disabled tags do not resolve their arguments"
+        settings.TEMPLATE_DEBUG = False
+        template = self.compile('{% details a.b %}')
+        counter = ResolveCounter()
+        self.assertEqual(template.render(Context({'a': counter})), '')
+        self.assertEqual(counter.resolved, 0)
+
+    def test_block_tags_render_content(self):
+        settings.TEMPLATE_DEBUG = False
+        template = self.compile(
+            '{% resolutions %}a{% endresolutions %}'
+            '{% nplusone %}b{% endnplusone %}'
+        )
+        self.assertEqual([node.__class__ for node in template.nodelist][1:],
+                         [ContentNode, ContentNode])
+        self.assertEqual(template.render(Context()), 'ab')
+
+    def test_compiled_if_template_debug_true(self):
+        template = self.compile('{% details a %}')
+        self.assertFalse(EMPTY_NODE in list(template.nodelist))
+
+
+class BreakpointTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        settings.TEMPLATE_DEBUG = True
+        self.triggered = []
+        self.trigger = SnapshotNode.__dict__['trigger']
+        SnapshotNode.trigger = lambda node, context: self.triggered.append(
+            context['x'])
+
+    def tearDown(self):
+        SnapshotNode.trigger = self.trigger
+
+    def render(self, options):
+        "Render a breakpoint with the options in a loop over 1 to 10."
+        Template(
+            '{% load debug_tags %}{% for x in items %}{% snapshot ' +
+            options + ' %}{% endfor %}'
+        ).render(Context({'items': list(range(1, 11))}))
+        return self.triggered
+
+    def test_condition(self):
+        self.assertEqual(self.render('if x > 4 and x != 7'), [5, 6, 8, 9, 10])
+
+    def test_every(self):
+        self.assertEqual(self.render('every 3'), [3, 6, 9])
+
+    def test_after(self):
+        self.assertEqual(self.render('after 8'), [9, 10])
+
+    def test_combined(self):
+        "Assure only renders where the condition holds are counted"
+        self.assertEqual(self.render('after 1 every 2 if x > 4'), [7, 9])
+
+    def test_counted_per_render(self):
+        template = Template(
+            '{% load debug_tags %}{% for x in items %}{% snapshot after 1 %}'
+            '{% endfor %}'
+        )
+        for y in range(2):
+            template.render(Context({'items': [1, 2]}))
+        self.assertEqual(self.triggered, [2, 2])
+
+    def test_invalid_options(self):
+        for options in ('every', 'every 0', 'after x', 'if', 'when x'):
+            self.assertRaises(TemplateSyntaxError, self.render, options)
+
+
+class ResolveCounter(object):
+
+    def __init__(self):
+        self.resolved = 0
+
+    @property
+    def b(self):
+        self.resolved += 1
+        return 'b'
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.template import Context, Template
+
+from template_debug.tests.base import TemplateDebugTestCase, use_memory_sink
+from template_debug.usage import TrackingDict, UsageTracker, usage_stats
+
+
+class TrackingDictTestCase(TemplateDebugTestCase):
+
+    def test_records_reads(self):
+        tracking = TrackingDict({'a': 1, 'b': 2, 'c': 3})
+        self.assertTrue('a' in tracking)
+        tracking['b']
+        tracking.get('c')
+        tracking.get('d')
+        self.assertEqual(tracking.read, set(['b', 'c']))
+
+
+class UsageTrackerTestCase(TemplateDebugTestCase):
+
+    def render(self, source, context):
+        with UsageTracker(context) as tracker:
+            Template(source).render(context)
+        return tracker
+
+    def test_unused_by_layer(self):
+        context = Context({'used': 1, 'unused': 2, 'shadowed': 3})
+        context.update({'shadowed': 4, 'also_unused': 5})
+        tracker = self.render('{{ used }}{{ shadowed }}{% if x %}{% endif %}',
+                              context)
+        self.assertEqual(tracker.unused, {
+            'layer 1': ['shadowed', 'unused'],
+            'layer 2': ['also_unused'],
+        })
+
+    def test_restores_context(self):
+        layer = {'a': 1}
+        context = Context(layer)
+        self.render('{% with b=a %}{{ b }}{% endwith %}', context)
+        self.assertTrue(context.dicts[1] is layer)
+        self.assertEqual(len(context.dicts), 2)
+
+
+class UnusedVariablesTagTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        settings.TEMPLATE_DEBUG = True
+        usage_stats.clear()
+        self.memory_sink = use_memory_sink()
+        self.sink = self.memory_sink.__enter__()
+
+    def tearDown(self):
+        self.memory_sink.__exit__(None, None, None)
+
+    def test_aggregates_renders(self):
+        template = Template(
+            '{% load debug_tags %}{% unused_variables %}{{ a }}'
+            '{% endunused_variables %}'
+        )
+        self.assertEqual(template.render(Context({'a': 1, 'b': 2})), '1')
+        template.render(Context({'a': 1, 'b': 2}))
+        rows = usage_stats.report()
+        self.assertEqual(rows[0], {'layer': 'layer 1', 'name': 'b',
+                                   'provided': 2, 'unused': 2})
+        self.assertEqual(rows[1]['unused'], 0)
+        self.assertEqual([record.tag for record in self.sink.records()],
+                         ['unused_variables', 'unused_variables'])
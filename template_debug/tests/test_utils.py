@@ -1,8 +1,15 @@
+from django.contrib.auth.models import Permission, User
+from django.template import Context, Template
 from django.test.client import RequestFactory
+from django.utils.functional import SimpleLazyObject, cached_property
 
 from template_debug.tests.base import TemplateDebugTestCase
 from template_debug.utils import (_flatten, get_variables, get_details,
-    is_valid_in_template, get_attributes)
+    get_variable_index, get_shadowed_variables,
+    is_valid_in_template, get_attributes, introspect, classify,
+    LRUCache, _attribute_cache, bounded_repr, bound_details,
+    get_queryset_details)
+from template_debug.queries import QueryCounter
 
 
 try:
@@ -77,6 +84,16 @@ class GetVariablesTestCase(TemplateDebugTestCase):
         variables = get_variables(self._get_context(self.request, {'a': 3}))
         self.assertTrue('a' in variables)
 
+    def test_nested_context(self):
+        "Assure layers that are contexts themselves are indexed"
+        context = Context(Context({'a': 1, 'b': 2}))
+        context.update({'b': 3})
+        self.assertEqual(get_variables(context), ['False', 'None', 'True',
+                                                  'a', 'b'])
+        index = get_variable_index(context)
+        self.assertEqual(index['a'], [1])
+        self.assertEqual(index['b'], [2, 1])
+
     def test_custom_processors(self):
         variables = get_variables(self._get_context(
             self.request, {}, processors=[])
@@ -88,6 +105,29 @@ class GetVariablesTestCase(TemplateDebugTestCase):
         self.assertTrue('custom_processor_var' in variables)
 
 
+class GetVariableIndexTestCase(TemplateDebugTestCase):
+    """TestCase for get_variable_index"""
+
+    def setUp(self):
+        self.context = Context({'a': 1, 'b': 2})
+        self.context.update({'a': 3})
+        self.top = len(self.context.dicts) - 1
+
+    def test_layers(self):
+        index = get_variable_index(self.context)
+        self.assertEqual(index['a'], [self.top, self.top - 1])
+        self.assertEqual(index['b'], [self.top - 1])
+
+    def test_sorted(self):
+        index = get_variable_index(self.context)
+        self.assertEqual(list(index), sorted(index))
+        self.assertEqual(get_variables(self.context), list(index))
+
+    def test_shadowed(self):
+        shadowed = get_shadowed_variables(get_variable_index(self.context))
+        self.assertEqual(shadowed, {'a': [self.top - 1]})
+
+
 class TestClass(object):
 
     def _private(self):
@@ -146,6 +186,80 @@ class IsValidInTemplateTestCase(TemplateDebugTestCase):
         )
 
 
+class LRUCacheTestCase(TemplateDebugTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertTrue('a' in cache)
+        self.assertTrue('c' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_get_default(self):
+        self.assertEqual(LRUCache(2).get('missing', 'default'), 'default')
+
+
+class AttributeCacheTestCase(TemplateDebugTestCase):
+
+    def setUp(self):
+        _attribute_cache.clear()
+
+    def test_class_verdicts_cached(self):
+        "Assure routine verdicts are stored per class"
+        get_attributes(TestClass())
+        verdicts = _attribute_cache.get(TestClass)
+        self.assertEqual(verdicts['valid_method'], (True, 'routine'))
+        self.assertEqual(verdicts['takes_args'], (False, 'routine'))
+        self.assertEqual(verdicts['alters_data'], (False, 'routine'))
+
+    def test_properties_checked_per_instance(self):
+        "Assure properties are evaluated for every instance"
+        class PropertyClass(object):
+            def __init__(self, fails):
+                self.fails = fails
+
+            @property
+            def value(self):
+                if self.fails:
+                    raise ValueError
+                return 1
+        self.assertTrue('value' in get_attributes(PropertyClass(False)))
+        self.assertFalse('value' in get_attributes(PropertyClass(True)))
+        self.assertEqual(_attribute_cache.get(PropertyClass)['value'],
+                         (None, 'property'))
+
+    def test_instance_attribute_shadows_class(self):
+        "Assure instance attributes take precedence over cached verdicts"
+        test_object = TestClass()
+        test_object.takes_args = 'not a method'
+        self.assertTrue(is_valid_in_template(test_object, 'takes_args'))
+        self.assertFalse(is_valid_in_template(TestClass(), 'takes_args'))
+
+    def test_static_and_class_methods(self):
+        class MethodsClass(object):
+            @staticmethod
+            def static_no_args():
+                return 1
+
+            @staticmethod
+            def static_args(x):
+                return x
+
+            @classmethod
+            def class_no_args(cls):
+                return cls
+
+            @classmethod
+            def class_args(cls, x):
+                return x
+        attrs = set(get_attributes(MethodsClass()))
+        self.assertEqual(attrs, set(['static_no_args', 'class_no_args']))
+
+
 class GetAttributesTestCase(TemplateDebugTestCase):
 
     def setUp(self):
@@ -160,6 +274,84 @@ class GetAttributesTestCase(TemplateDebugTestCase):
             'has_kwargs and valid_method are the only valid routines of TestObject'
         )
 
+    def test_class(self):
+        """
+        Assure the methods of a class are not listed for the class itself, as
+        templates can not call them without an instance
+        """
+        self.assertEqual(get_attributes(TestClass), [])
+        self.assertEqual(Template('{{ c.valid_method }}').render(
+            Context({'c': TestClass})), '')
+
+
+class CountingClass(object):
+
+    def __init__(self):
+        self.reads = 0
+
+    @property
+    def counted(self):
+        self.reads += 1
+        return self.reads
+
+    def method(self):
+        return True
+
+    @cached_property
+    def cached(self):
+        self.reads += 1
+        return 'cached'
+
+
+class IntrospectTestCase(TemplateDebugTestCase):
+
+    def test_kinds(self):
+        results = dict((attr, kind) for attr, value, kind in
+                       introspect(CountingClass()))
+        self.assertEqual(results, {
+            'cached': 'value', 'counted': 'value', 'method': 'routine',
+            'reads': 'value'
+        })
+
+    def test_get_details_reads_once(self):
+        "Assure get_details evaluates each attribute only once"
+        test_object = CountingClass()
+        details = get_details(test_object)
+        self.assertEqual(details['cached'], 'cached')
+        self.assertEqual(test_object.reads, 2)
+
+    def test_get_attributes_reads_once(self):
+        test_object = CountingClass()
+        get_attributes(test_object)
+        self.assertEqual(test_object.reads, 2)
+
+    def test_unevaluated(self):
+        "Assure costly attributes are not read unless evaluation is allowed"
+        test_object = CountingClass()
+        details = get_details(test_object, evaluate=False)
+        self.assertEqual(test_object.reads, 0)
+        self.assertEqual(details['counted'], 'unevaluated property')
+        self.assertEqual(details['cached'], 'unevaluated cached_property')
+        self.assertEqual(details['method'], 'routine')
+        self.assertEqual(set(get_attributes(test_object, evaluate=False)),
+                         set(['cached', 'counted', 'method', 'reads']))
+
+    def test_budget(self):
+        "Assure no more costly attributes are read than the budget allows"
+        test_object = CountingClass()
+        details = get_details(test_object, budget=1)
+        self.assertEqual(test_object.reads, 1)
+        self.assertEqual(details['counted'], 'unevaluated property')
+
+    def test_classify(self):
+        test_object = CountingClass()
+        self.assertEqual(classify(test_object, 'counted'), 'property')
+        self.assertEqual(classify(test_object, 'cached'), 'cached_property')
+        self.assertEqual(classify(test_object, 'method'), 'routine')
+        self.assertEqual(classify(test_object, 'reads'), 'attribute')
+        test_object.cached
+        self.assertEqual(classify(test_object, 'cached'), 'attribute')
+
 
 class GetDetailsTestCase(TemplateDebugTestCase):
 
@@ -202,6 +394,42 @@ class GetDetailsTestCase(TemplateDebugTestCase):
                     ('ManyRelatedManager', 'RelatedManager', 'EmptyManager',)
                 )
 
+    def test_query_counts(self):
+        "Assure queries run when reading related objects are reported"
+        permission = Permission.objects.all()[0]
+        details = get_details(permission, queries=True)
+        self.assertEqual(details['META_queries']['content_type']['count'], 1)
+        self.assertTrue('name' not in details['META_queries'])
+
+    def test_strict(self):
+        "Assure strict mode reads no attribute that would query the database"
+        permission = Permission.objects.all()[0]
+        with QueryCounter() as counter:
+            details = get_details(permission, strict=True)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(details['content_type'], 'unevaluated related')
+        self.assertEqual(details['name'], permission.name)
+
+    def test_strict_lazy_object(self):
+        "Assure strict mode does not set up a lazy object that would query"
+        self.create_user(username='alice')
+        user = SimpleLazyObject(lambda: User.objects.get(username='alice'))
+        with QueryCounter() as counter:
+            details = get_details(user, strict=True)
+            self.assertEqual(get_attributes(user, strict=True), [])
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(details['META_class_name'], 'SimpleLazyObject')
+        self.assertTrue(details['META_unevaluated'])
+        self.assertEqual(get_details(user)['META_class_name'], 'User')
+        self.assertEqual(get_details(user, strict=True)['username'], 'alice')
+
+    def test_lazy_object_not_evaluated(self):
+        user = SimpleLazyObject(lambda: User.objects.get(username='alice'))
+        with QueryCounter() as counter:
+            details = get_details(user, evaluate=False)
+        self.assertEqual(counter.count, 0)
+        self.assertTrue(details['META_unevaluated'])
+
     def test_module_and_class_added(self):
         user_details = get_details(self.get_context()['user'])
         self.assertEqual(user_details['META_module_name'],
@@ -232,3 +460,127 @@ class GetDetailsTestCase(TemplateDebugTestCase):
             user_details['META_class_name'] == 'User',
             user_details['META_class_name'] == 'AnonymousUser'
         )))
+
+
+class LongIterable(list):
+    "A list that fails if more than a few of its items are read"
+
+    def __iter__(self):
+        for index, item in enumerate(list.__iter__(self)):
+            if index > 5:
+                raise AssertionError('Read too many items')
+            yield item
+
+
+class BoundedReprTestCase(TemplateDebugTestCase):
+
+    def test_short_values(self):
+        "Assure values within the limits are shown whole"
+        self.assertEqual(bounded_repr([1, (2, ), {3: 4}]), '[1, (2,), {3: 4}]')
+        self.assertEqual(bounded_repr([]), '[]')
+        self.assertEqual(bounded_repr(5), '5')
+
+    def test_max_items(self):
+        "Assure the length of truncated containers is shown"
+        self.assertEqual(bounded_repr(list(range(100)), max_items=3),
+                         '[0, 1, 2, ...] (len=100)')
+        self.assertEqual(bounded_repr(dict.fromkeys([1]), max_items=0),
+                         '{...} (len=1)')
+
+    def test_max_string(self):
+        value = bounded_repr('a' * 1000, max_string=3)
+        self.assertTrue(value.endswith("'aaa'... (len=1000)"))
+
+    def test_max_depth(self):
+        self.assertEqual(bounded_repr([[[1]]], max_depth=2),
+                         '[[[...] (len=1)]]')
+
+    def test_reads_shown_items_only(self):
+        "Assure the work done depends on the limits, not the size"
+        value = LongIterable(range(10 ** 5))
+        self.assertEqual(bounded_repr(value, max_items=2),
+                         '[0, 1, ...] (len=100000)')
+
+    def test_displays_without_quotes(self):
+        self.assertEqual(repr({'a': bounded_repr([1])}).replace("u'", "'"),
+                         "{'a': [1]}")
+
+    def test_bound_details(self):
+        details = bound_details({'a': list(range(20)), 'META_x': [1]},
+                                max_items=1)
+        self.assertEqual(details, {'a': '[0, ...] (len=20)', 'META_x': [1]})
+
+
+class QuerySetHolder(object):
+
+    def __init__(self):
+        self.permissions = Permission.objects.all()
+        self.permission = Permission.objects.get(codename='add_user')
+
+
+class QuerySetDetailsTestCase(TemplateDebugTestCase):
+
+    def test_queryset_not_evaluated(self):
+        "Assure no query is run for the details of a queryset"
+        queryset = Permission.objects.filter(codename='add_user')
+        with QueryCounter() as counter:
+            details = get_details(queryset)
+            get_attributes(queryset)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(details['ordered'], 'unevaluated property')
+        queryset_details = details['META_queryset']
+        self.assertEqual(queryset_details['model'], 'auth.Permission')
+        self.assertTrue('add_user' in queryset_details['sql'])
+        self.assertFalse(queryset_details['evaluated'])
+
+    def test_strict_details_of_queryset_attribute(self):
+        "Assure the bounded repr of a queryset attribute runs no query"
+        holder = QuerySetHolder()
+        with QueryCounter() as counter:
+            details = bound_details(get_details(holder, strict=True),
+                                    strict=True)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(details['permissions'],
+                         '<QuerySet model=auth.Permission unevaluated>')
+        # The __str__ of a Permission reads its content type
+        self.assertEqual(details['permission'], '<unevaluated repr>')
+
+    def test_bounded_repr_of_evaluated_queryset(self):
+        self.create_user(username='alice')
+        queryset = User.objects.filter(username='alice')
+        list(queryset)
+        with QueryCounter() as counter:
+            text = bounded_repr(queryset)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(text, '<QuerySet [<User: alice>]>')
+
+    def test_evaluated(self):
+        queryset = Permission.objects.all()
+        rows = len(queryset)
+        details = get_queryset_details(queryset)
+        self.assertTrue(details['evaluated'])
+        self.assertEqual(details['cached_rows'], rows)
+
+    def test_related_lookups(self):
+        queryset = Permission.objects.select_related(
+            'content_type').prefetch_related('group_set')
+        details = get_queryset_details(queryset)
+        self.assertTrue(details['select_related'])
+        self.assertEqual(details['prefetch_related'], ['group_set'])
+
+    def test_manager(self):
+        "Assure managers are described by their queryset"
+        user = self.create_user()
+        with QueryCounter() as counter:
+            details = get_details(user.groups)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(details['META_queryset']['model'], 'auth.Group')
+
+    def test_empty_result_set(self):
+        details = get_queryset_details(Permission.objects.filter(pk__in=[]))
+        self.assertTrue(details['sql'].startswith('no sql'))
+
+    def test_explain(self):
+        "Assure the row estimate is None on databases without one"
+        details = get_queryset_details(Permission.objects.all(), explain=True)
+        self.assertEqual(details['estimated_rows'], None)
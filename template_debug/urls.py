@@ -0,0 +1,13 @@
+try:
+    from django.conf.urls import url
+except ImportError:
+    from django.conf.urls.defaults import url
+
+from template_debug import views
+
+
+urlpatterns = [
+    url(r'^$', views.request_list, name='template_debug_requests'),
+    url(r'^(?P<request_id>\d+)/$', views.request_detail,
+        name='template_debug_request'),
+]
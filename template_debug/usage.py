@@ -0,0 +1,177 @@
+"""
+Detection of context variables that are provided to a template but never read
+while it renders.
+"""
+
+from __future__ import unicode_literals
+from threading import Lock
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+from django.template import RequestContext
+
+from template_debug.processors import get_variable_processor
+
+
+PROCESSORS_LABEL = 'context processors'
+
+
+class TrackingDict(dict):
+    """
+    A copy of a layer of a context that records the names read from it.
+    Checking for a name with `in` is not a read, as a context checks every
+    layer for a name before reading it from the first that has it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TrackingDict, self).__init__(*args, **kwargs)
+        self.read = set()
+
+    def __getitem__(self, key):
+        value = super(TrackingDict, self).__getitem__(key)
+        self.read.add(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+
+def get_layer_label(context, layer):
+    """
+    Given a context and the index of one of its layers, return a label for
+    the layer, such as 'context processors'
+    """
+    if layer == 0:
+        return 'builtins'
+    if layer == get_processors_index(context):
+        return PROCESSORS_LABEL
+    return 'layer {0}'.format(layer)
+
+
+def get_processors_index(context):
+    """
+    Given a context, return the index of the layer that holds the output of
+    the context processors, or None if it is unknown
+    """
+    # Django >= 1.8 keeps the output of context processors in one layer
+    index = getattr(context, '_processors_index', None)
+    if index is not None or not isinstance(context, RequestContext):
+        return index
+    # Django < 1.8 pushes it above the dictionary given to RequestContext, if
+    # any. Only the variables recorded by instrument_processors tell them
+    # apart.
+    for layer in (1, 2):
+        names = context.dicts[layer] if layer < len(context.dicts) else None
+        if names and all(get_variable_processor(name) for name in names):
+            return layer
+    return None
+
+
+def get_processor_labels(names):
+    """
+    Given the names of the variables of the context processors layer, return
+    a dictionary mapping a label naming each processor, as recorded by
+    template_debug.processors.instrument_processors, to its names. Names of
+    processors that are not instrumented are labeled 'context processors'.
+    """
+    labels = OrderedDict()
+    for name in names:
+        processor = get_variable_processor(name)
+        label = PROCESSORS_LABEL if processor is None else \
+            'context processor {0}'.format(processor)
+        labels.setdefault(label, []).append(name)
+    return labels
+
+
+class UsageTracker(object):
+    """
+    Context manager that replaces the layers of a context with TrackingDicts
+    while a block renders. Afterwards, `unused` maps the label of each layer
+    to the sorted names it provided that were never read. The context
+    processors layer is split into a label for each processor. Names shadowed
+    by a higher layer are never read from the lower one. The builtins, such as
+    True and None, are left alone.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.unused = OrderedDict()
+        self.provided = OrderedDict()
+        self._originals = []
+
+    def __enter__(self):
+        dicts = self.context.dicts
+        for layer in range(1, len(dicts)):
+            self._originals.append((layer, dicts[layer]))
+            dicts[layer] = TrackingDict(dicts[layer])
+        return self
+
+    def __exit__(self, *exc_info):
+        dicts = self.context.dicts
+        for layer, original in self._originals:
+            tracking = dicts[layer]
+            # Keep any variables set while rendering, e.g. by {% url as %}
+            if tracking != original:
+                original.clear()
+                original.update(tracking)
+            dicts[layer] = original
+            label = get_layer_label(self.context, layer)
+            if label == PROCESSORS_LABEL:
+                labels = get_processor_labels(sorted(tracking))
+            else:
+                labels = {label: sorted(tracking)}
+            for label, names in labels.items():
+                self.provided[label] = names
+                self.unused[label] = [name for name in names
+                                      if name not in tracking.read]
+        self._originals = []
+
+
+class UsageStats(object):
+    """
+    Thread safe counts, aggregated across renders, of how often each variable
+    of each layer was provided and how often it went unused
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = Lock()
+
+    def add(self, tracker):
+        """Given a finished UsageTracker, add its variables to the counts"""
+        with self._lock:
+            for label, names in tracker.provided.items():
+                unused = set(tracker.unused[label])
+                for name in names:
+                    counts = self._counts.setdefault((label, name), [0, 0])
+                    counts[0] += 1
+                    if name in unused:
+                        counts[1] += 1
+
+    def report(self):
+        """
+        Return a list of dictionaries with the 'layer' and 'name' of each
+        variable, how often it was 'provided' and how often it was 'unused',
+        with the most often unused first
+        """
+        with self._lock:
+            rows = [{'layer': label, 'name': name, 'provided': provided,
+                     'unused': unused}
+                    for (label, name), (provided, unused)
+                    in self._counts.items()]
+        return sorted(rows, key=lambda row: (-row['unused'], row['layer'],
+                                             row['name']))
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# Counts recorded by the unused_variables tag
+usage_stats = UsageStats()
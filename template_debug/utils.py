@@ -1,15 +1,148 @@
 from __future__ import unicode_literals
-from functools import partial
-from collections import Iterable
-from inspect import getargspec, isroutine
+from collections import deque
+from inspect import isroutine, getmro
+from itertools import islice
+import json
+from threading import Lock
 
+try:
+    from collections.abc import Iterable
+except ImportError:
+    # Python 2
+    from collections import Iterable
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+try:
+    from inspect import signature, Parameter
+except ImportError:
+    # Python 2 has no inspect.signature
+    from inspect import getargspec, ismethod
+    signature = None
+
+try:
+    from types import InstanceType
+except ImportError:
+    # Python 3 has no old style classes
+    InstanceType = None
+
+
+from django.db import DatabaseError, connections
+from django.db.models import Manager
+from django.db.models.query import QuerySet
+from django.http import HttpRequest
+from django.template.context import BaseContext
+from django.utils.functional import LazyObject
+
+from template_debug.queries import QueryCounter, QueryNotAllowed
+try:
+    from django.utils.functional import empty
+except ImportError:
+    # Django < 1.4
+    empty = None
 
 try:
-    from django.utils.six import PY3, string_types
+    from django.utils.six import PY3, iteritems, string_types, text_type
 except ImportError:
     # Django < 1.5. No Python 3 support
     PY3 = False
     string_types = basestring
+    text_type = unicode
+
+    def iteritems(d):
+        return d.iteritems()
+
+
+# Maximum number of classes whose attribute verdicts are remembered
+ATTRIBUTE_CACHE_SIZE = 256
+
+# Common Django class names that are displayed in place of their value
+MANAGER_CLASS_NAMES = ('ManyRelatedManager', 'RelatedManager', 'EmptyManager')
+
+# Modules whose descriptors load related objects from the database
+RELATED_MODULES = ('django.db.models.fields.related',
+                   'django.contrib.contenttypes')
+
+# Classifications of attributes that may run arbitrary code or queries when
+# read. introspect only reads these when evaluation is allowed.
+COSTLY_KINDS = ('property', 'cached_property', 'related', 'deferred',
+                'descriptor')
+
+# Attributes of an HttpRequest that read its body, which can only be read
+# once, mapped to the attribute the body is kept in once read
+REQUEST_BODY_ATTRIBUTES = {
+    'body': '_body',
+    'POST': '_post',
+    'FILES': '_files',
+    'REQUEST': '_post',
+}
+
+# Limits of the representation of detail values by bounded_repr
+REPR_MAX_ITEMS = 10
+REPR_MAX_STRING = 80
+REPR_MAX_DEPTH = 3
+
+# Container types whose items bounded_repr displays, with their delimiters
+REPR_CONTAINERS = (
+    (list, '[', ']'),
+    (tuple, '(', ')'),
+    (deque, 'deque([', '])'),
+    (frozenset, 'frozenset({', '})'),
+    (set, '{', '}'),
+)
+
+
+class LRUCache(object):
+    """
+    A small thread safe mapping that holds at most `maxsize` items, evicting
+    the least recently used item when full.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                del self._data[next(iter(self._data))]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Return a list of (key, value) tuples, least recently used first"""
+        with self._lock:
+            return list(self._data.items())
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Maps a class to a dictionary of {attribute name: (verdict, classification)},
+# where the verdict is True or False if it can be decided from the class alone,
+# otherwise None.
+_attribute_cache = LRUCache(ATTRIBUTE_CACHE_SIZE)
 
 
 def _flatten(iterable):
@@ -28,52 +161,438 @@ def get_variables(context):
     """
     Given a context, return a sorted list of variable names in the context
     """
-    return sorted(set(_flatten(context.dicts)))
+    return list(get_variable_index(context))
 
 
-def get_details(var):
+def get_variable_index(context):
+    """
+    Given a context, return an ordered dictionary that maps each variable name
+    in the context, sorted by name, to the list of indexes of the layers in
+    context.dicts that provide it. The first layer listed is the one whose
+    value is used in the template; any others are shadowed by it.
+    """
+    index = {}
+    dicts = context.dicts
+    # The last layer takes precedence when a variable is looked up
+    for layer in range(len(dicts) - 1, -1, -1):
+        # A layer may itself be a context, as in Context(Context({...}))
+        stack = [dicts[layer]]
+        while stack:
+            mapping = stack.pop()
+            if isinstance(mapping, BaseContext):
+                stack.extend(mapping.dicts)
+                continue
+            for name in mapping:
+                layers = index.setdefault(name, [])
+                if not layers or layers[-1] != layer:
+                    layers.append(layer)
+    return OrderedDict(sorted(index.items()))
+
+
+def format_variable_index(index):
+    """
+    Given a variable index from get_variable_index return a line for each
+    variable with the context layer that provides it and the layers it shadows.
+    """
+    lines = []
+    for name, layers in index.items():
+        line = '{0}: layer {1}'.format(name, layers[0])
+        if len(layers) > 1:
+            line += ' (shadows {0})'.format(
+                ', '.join(str(layer) for layer in layers[1:]))
+        lines.append(line)
+    return lines
+
+
+def get_shadowed_variables(index):
+    """
+    Given the result of get_variable_index, return a dictionary mapping each
+    shadowed variable to the list of layers it is shadowed in.
+    """
+    return dict((name, layers[1:]) for name, layers in index.items()
+                if len(layers) > 1)
+
+
+def get_details(var, evaluate=True, budget=None, strict=False, queries=False,
+                explain=False):
     """
     Given a variable inside the context, obtain the attributes/callables,
     their values where possible, and the module name and class name if possible
+
+    If `queries` is True, 'META_queries' maps each attribute that ran database
+    queries when read to a dictionary of the query 'count' and SQL 'time'.
+
+    If the variable is a QuerySet or a manager, 'META_queryset' describes its
+    query as returned by get_queryset_details, with the `explain` estimate
+    unless `strict` is True.
+
+    A lazy object, such as request.user, that is not set up yet is only set
+    up as `evaluate` and `strict` allow reading a costly attribute. If it is
+    not, 'META_unevaluated' is True and no attribute is read.
     """
     var_data = {}
     # Obtain module and class details if available and add them in
     module = getattr(var, '__module__', '')
-    kls = getattr(getattr(var, '__class__', ''), '__name__', '')
+    var = _unwrap(var, evaluate, strict)
+    if _is_lazy(var):
+        # The __class__ of a lazy object is that of the object it wraps
+        kls = type(var).__name__
+    else:
+        kls = getattr(getattr(var, '__class__', ''), '__name__', '')
     if module:
         var_data['META_module_name'] = module
     if kls:
         var_data['META_class_name'] = kls
-    for attr in get_attributes(var):
-        value = _get_detail_value(var, attr)
+    if _is_lazy(var):
+        var_data['META_unevaluated'] = True
+        return var_data
+    queryset = _get_queryset(var)
+    if queryset is not None:
+        var_data['META_queryset'] = get_queryset_details(
+            queryset, explain and not strict)
+    query_log = {} if queries else None
+    for attr, value, kind in introspect(var, evaluate, budget, strict,
+                                        query_log):
+        value = _get_detail_value(value, kind)
         if value is not None:
             var_data[attr] = value
+    if queries:
+        var_data['META_queries'] = query_log
     return var_data
 
 
-def _get_detail_value(var, attr):
+def _get_queryset(var):
     """
-    Given a variable and one of its attributes that are available inside of
-    a template, return its 'method' if it is a callable, its class name if it
-    is a model manager, otherwise return its value
+    Given a variable, return it if it is a QuerySet, the QuerySet of a manager
+    or None. Neither runs a query.
     """
-    value = getattr(var, attr)
-    # Rename common Django class names
-    kls = getattr(getattr(value, '__class__', ''), '__name__', '')
-    if kls in ('ManyRelatedManager', 'RelatedManager', 'EmptyManager'):
-        return kls
-    if callable(value):
+    if isinstance(var, QuerySet):
+        return var
+    if isinstance(var, Manager):
+        # Django < 1.6
+        get_queryset = getattr(var, 'get_queryset', None) or \
+            var.get_query_set
+        return get_queryset()
+    return None
+
+
+def get_queryset_details(queryset, explain=False):
+    """
+    Given a QuerySet, return a dictionary with its 'model', the 'sql' it would
+    run, whether it is 'evaluated' and how many rows it holds if so, and its
+    'select_related' and 'prefetch_related' lookups. No query is run.
+
+    If `explain` is True, 'estimated_rows' is the number of rows the database
+    expects the query to return according to EXPLAIN, or None if the database
+    does not provide an estimate.
+    """
+    query = queryset.query
+    meta = queryset.model._meta
+    result_cache = queryset._result_cache
+    details = {
+        'model': '{0}.{1}'.format(meta.app_label, meta.object_name),
+        'sql': _get_sql(queryset),
+        'evaluated': result_cache is not None,
+        'select_related': query.select_related,
+        'prefetch_related': [getattr(lookup, 'prefetch_to', lookup)
+                             for lookup in queryset._prefetch_related_lookups],
+    }
+    if result_cache is not None:
+        details['cached_rows'] = len(result_cache)
+    if explain:
+        details['estimated_rows'] = estimate_rows(queryset)
+    return details
+
+
+def _get_sql(queryset):
+    """
+    Given a QuerySet, return its SQL with the parameters filled in, as
+    displayed by Django, or a note if it can not be compiled
+    """
+    try:
+        return text_type(queryset.query)
+    except Exception as e:
+        # e.g. EmptyResultSet, for a filter that matches nothing
+        return 'no sql ({0})'.format(e.__class__.__name__)
+
+
+def estimate_rows(queryset):
+    """
+    Given a QuerySet, return the number of rows that the database estimates
+    it returns, using EXPLAIN. Return None if the database is not PostgreSQL
+    or MySQL, which provide estimates, or the query can not be explained.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor not in ('postgresql', 'mysql'):
+        return None
+    try:
+        sql, params = queryset.query.get_compiler(
+            connection=connection).as_sql()
+    except Exception:
+        return None
+    cursor = connection.cursor()
+    try:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, string_types):
+                plan = json.loads(plan)
+            return plan[0]['Plan']['Plan Rows']
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [column[0] for column in cursor.description]
+        return cursor.fetchone()[columns.index('rows')]
+    except DatabaseError:
+        return None
+    finally:
+        cursor.close()
+
+
+def _get_detail_value(value, kind):
+    """
+    Given the value and kind of an attribute from introspect, return 'routine'
+    if it is a callable, its class name if it is a model manager, a note
+    if it was left unevaluated, otherwise return the value
+    """
+    if kind == 'manager':
+        return getattr(getattr(value, '__class__', ''), '__name__', '')
+    if kind == 'routine':
         return 'routine'
+    if kind == 'unevaluated':
+        return 'unevaluated {0}'.format(value)
     return value
 
 
-def get_attributes(var):
+class BoundedRepr(text_type):
+    """
+    Text from bounded_repr. It is its own repr, so it displays without quotes
+    inside of a pprinted dictionary.
+    """
+
+    def __repr__(self):
+        return text_type(self) if PY3 else self.encode('utf-8')
+
+
+def bounded_repr(value, max_items=REPR_MAX_ITEMS, max_string=REPR_MAX_STRING,
+                 max_depth=REPR_MAX_DEPTH):
+    """
+    Given a value, return a BoundedRepr of it like reprlib does. At most
+    `max_items` items of each container and `max_string` characters of each
+    string are shown, down to `max_depth` levels of nesting. Truncated values
+    are followed by their len(). Only the items shown are read, so the time
+    taken depends on the limits rather than the size of the value. QuerySets
+    are never evaluated, nor the body of a request read.
+    """
+    return BoundedRepr(_bounded_repr(value, max_items, max_string,
+                                     max_depth))
+
+
+def _bounded_repr(value, max_items, max_string, depth):
+    if isinstance(value, LazyObject):
+        # Checking the class of a lazy object sets it up, which may query
+        if value._wrapped is empty:
+            return _repr(value)
+        value = value._wrapped
+    if isinstance(value, HttpRequest):
+        # Before Django 1.8 the repr of a request shows its POST, which reads
+        # the body
+        return '<{0}: {1} {2}>'.format(type(value).__name__, value.method,
+                                       _repr(value.get_full_path()))
+    if isinstance(value, QuerySet):
+        # The repr of a QuerySet runs its query unless it was evaluated
+        if value._result_cache is None:
+            meta = value.model._meta
+            return '<QuerySet model={0}.{1} unevaluated>'.format(
+                meta.app_label, meta.object_name)
+        return '<QuerySet {0}>'.format(_bounded_repr(
+            value._result_cache, max_items, max_string, depth))
+    if isinstance(value, (string_types, bytes)):
+        if len(value) <= max_string:
+            return _repr(value)
+        return '{0}... (len={1})'.format(_repr(value[:max_string]),
+                                          len(value))
+    if isinstance(value, dict):
+        start, end = '{', '}'
+        # Only the items shown are read, rather than a list of them all
+        items = iteritems(value)
+    else:
+        for kls, start, end in REPR_CONTAINERS:
+            if isinstance(value, kls):
+                items = value
+                break
+        else:
+            text = _repr(value)
+            if len(text) <= max_string:
+                return text
+            return text[:max_string] + '...'
+    length = len(value)
+    if not length:
+        return _repr(value)
+    if depth <= 0 or max_items <= 0:
+        return '{0}...{1} (len={2})'.format(start, end, length)
+    shown = []
+    for item in islice(items, max_items):
+        if isinstance(value, dict):
+            key, item = item
+            shown.append('{0}: {1}'.format(
+                _bounded_repr(key, max_items, max_string, depth - 1),
+                _bounded_repr(item, max_items, max_string, depth - 1)))
+        else:
+            shown.append(_bounded_repr(item, max_items, max_string,
+                                       depth - 1))
+    if length > max_items:
+        return '{0}{1}, ...{2} (len={3})'.format(start, ', '.join(shown), end,
+                                                  length)
+    if length == 1 and isinstance(value, tuple):
+        return '({0},)'.format(shown[0])
+    return '{0}{1}{2}'.format(start, ', '.join(shown), end)
+
+
+def _repr(value):
+    """Given a value, return its repr as text"""
+    try:
+        text = repr(value)
+    except QueryNotAllowed:
+        return '<unevaluated repr>'
+    except Exception as e:
+        return '<repr failed: {0}>'.format(e.__class__.__name__)
+    if isinstance(text, bytes):
+        return text.decode('utf-8', 'replace')
+    return text
+
+
+def bound_details(var_data, strict=False, **limits):
+    """
+    Given a dictionary from get_details, return a copy with the value of each
+    attribute replaced by its bounded_repr. META_ keys are copied as is. If
+    `strict` is True, reprs that would query the database, such as those of
+    models whose __str__ follows a relation, are left unevaluated.
+    """
+    with QueryCounter(strict):
+        return dict((key, value if key.startswith('META_') else
+                     bounded_repr(value, **limits))
+                    for key, value in var_data.items())
+
+
+def get_attributes(var, evaluate=True, budget=None, strict=False):
     """
     Given a varaible, return the list of attributes that are available inside
     of a template
     """
-    is_valid = partial(is_valid_in_template, var)
-    return list(filter(is_valid, dir(var)))
+    return [attr for attr, value, kind in
+            introspect(var, evaluate, budget, strict)]
+
+
+def introspect(var, evaluate=True, budget=None, strict=False, query_log=None):
+    """
+    Given a variable, generate a tuple of (name, value, kind) for each
+    attribute that is available inside of a template. Each attribute is read
+    at most once. The kind is 'manager' for Django related managers, 'routine'
+    for callables and 'value' for anything else.
+
+    Attributes classified as one of COSTLY_KINDS, such as properties and
+    related objects, are only read if `evaluate` is True and, when a `budget`
+    is given, at most `budget` of them are read. The rest are generated
+    without being read as (name, classification, 'unevaluated').
+
+    If `strict` is True, attributes that would query the database are not
+    read and are generated as unevaluated as well. If `query_log` is a
+    dictionary, it is filled with {name: {'count': count, 'time': seconds}}
+    for each attribute that ran queries when read.
+
+    The body of an HttpRequest is never read, as reading it may consume the
+    request stream, so its body, POST and FILES are generated as unevaluated
+    until the view reads them.
+
+    A lazy object that `evaluate` and `strict` do not allow to set up
+    generates nothing.
+    """
+    var = _unwrap(var, evaluate, strict)
+    if _is_lazy(var):
+        return
+    # Properties of querysets and managers, e.g. QuerySet.ordered, are not
+    # read, so nothing about them may run a query
+    if not evaluate or isinstance(var, (QuerySet, Manager)):
+        budget = 0
+    count_queries = strict or query_log is not None
+    for attr in dir(var):
+        # Remove private variables or methods
+        if attr.startswith('_'):
+            continue
+        verdict, classification = _get_class_info(var, attr)
+        if verdict is False:
+            continue
+        if attr in REQUEST_BODY_ATTRIBUTES and isinstance(var, HttpRequest) \
+                and not hasattr(var, REQUEST_BODY_ATTRIBUTES[attr]):
+            yield attr, 'request body', 'unevaluated'
+            continue
+        if classification in COSTLY_KINDS and budget is not None:
+            if budget <= 0:
+                yield attr, classification, 'unevaluated'
+                continue
+            budget -= 1
+        counter = QueryCounter(strict) if count_queries else None
+        # Remove any attributes that raise an acception when read
+        try:
+            if counter is None:
+                value = getattr(var, attr)
+            else:
+                with counter:
+                    value = getattr(var, attr)
+        except QueryNotAllowed:
+            yield attr, classification, 'unevaluated'
+            continue
+        except:
+            continue
+        finally:
+            if query_log is not None and counter.count:
+                query_log[attr] = {'count': counter.count,
+                                   'time': counter.time}
+        if _is_lazy(value):
+            # Checking the class of a lazy object sets it up
+            yield attr, value, 'value'
+            continue
+        if verdict is None and isroutine(value) and \
+                not _is_valid_routine(value):
+            continue
+        yield attr, value, _get_kind(value)
+
+
+def _unwrap(var, evaluate=True, strict=False):
+    """
+    Given a variable, return the object wrapped by it if it is a lazy object
+    such as request.user, so its attributes can be found on its class.
+
+    Setting up a lazy object, which may query the database, is like reading
+    a costly attribute: it is only done if `evaluate` is True, and if
+    `strict` is True only when it runs no query. Otherwise the lazy object is
+    returned as is.
+    """
+    if not isinstance(var, LazyObject):
+        return var
+    if var._wrapped is empty:
+        if not evaluate:
+            return var
+        try:
+            with QueryCounter(strict):
+                var._setup()
+        except QueryNotAllowed:
+            return var
+    return var._wrapped
+
+
+def _is_lazy(var):
+    """Given a variable from _unwrap, return True if it was left lazy"""
+    return isinstance(var, LazyObject)
+
+
+def _get_kind(value):
+    """Given an attribute's value, return its kind as used by introspect"""
+    kls = getattr(getattr(value, '__class__', ''), '__name__', '')
+    if kls in MANAGER_CLASS_NAMES:
+        return 'manager'
+    if callable(value):
+        return 'routine'
+    return 'value'
 
 
 def is_valid_in_template(var, attr):
@@ -84,25 +603,155 @@ def is_valid_in_template(var, attr):
     # Remove private variables or methods
     if attr.startswith('_'):
         return False
+    verdict = _get_class_verdict(var, attr)
+    if verdict is not None:
+        return verdict
     # Remove any attributes that raise an acception when read
     try:
         value = getattr(var, attr)
     except:
         return False
     if isroutine(value):
-        # Remove any routines that are flagged with 'alters_data'
-        if getattr(value, 'alters_data', False):
-            return False
-        else:
-            # Remove any routines that require arguments
-            try:
-                argspec = getargspec(value)
-                num_args = len(argspec.args) if argspec.args else 0
-                num_defaults = len(argspec.defaults) if argspec.defaults else 0
-                if num_args - num_defaults > 1:
-                    return False
-            except TypeError:
-                # C extension callables are routines, but getargspec fails with
-                # a TypeError when these are passed.
-                pass
+        return _is_valid_routine(value)
     return True
+
+
+def _is_valid_routine(routine, unbound=False):
+    """
+    Given a routine, return False if it is flagged with 'alters_data' or
+    requires arguments, otherwise True. If `unbound` is True, the first
+    argument is expected to be filled in by the instance (e.g. self).
+    """
+    if getattr(routine, 'alters_data', False):
+        return False
+    required = _count_required_args(routine)
+    # C extension callables are routines, but their signature is unknown.
+    if required is None:
+        return True
+    return required - (1 if unbound else 0) <= 0
+
+
+def _count_required_args(routine):
+    """
+    Given a routine, return the number of arguments that must be passed when
+    calling it, or None if this can not be determined.
+    """
+    if signature is None:
+        try:
+            argspec = getargspec(routine)
+        except TypeError:
+            return None
+        num_args = len(argspec.args) if argspec.args else 0
+        num_defaults = len(argspec.defaults) if argspec.defaults else 0
+        if ismethod(routine) and routine.__self__ is not None:
+            num_args -= 1
+        return num_args - num_defaults
+    try:
+        params = signature(routine).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    return len([param for param in params
+                if param.default is Parameter.empty and
+                param.kind not in (Parameter.VAR_POSITIONAL,
+                                   Parameter.VAR_KEYWORD)])
+
+
+def _get_type(var):
+    """Given a variable, return the class used to key the attribute cache"""
+    kls = type(var)
+    # All instances of old style classes share one type
+    if InstanceType is not None and kls is InstanceType:
+        return var.__class__
+    return kls
+
+
+def classify(var, attr):
+    """
+    Given a variable and one of its attributes, return how the attribute is
+    provided without reading it. This is one of 'attribute', 'routine',
+    'property', 'cached_property', 'related', 'deferred' or 'descriptor'.
+    """
+    return _get_class_info(var, attr)[1]
+
+
+def _get_class_verdict(var, attr):
+    """
+    Given a variable and one of its public attributes, return True or False if
+    the attribute's validity in templates can be decided from its class, or
+    None if the instance must be checked. Verdicts are cached per class.
+    """
+    return _get_class_info(var, attr)[0]
+
+
+def _get_class_info(var, attr):
+    """
+    Given a variable and one of its attributes, return a tuple of the verdict
+    from _get_class_verdict and the classification from classify.
+    """
+    try:
+        if attr in var.__dict__:
+            # Instance attributes may differ from one instance to the next
+            return None, 'attribute'
+    except Exception:
+        pass
+    kls = _get_type(var)
+    class_info = _attribute_cache.get(kls)
+    if class_info is None:
+        class_info = {}
+        _attribute_cache.set(kls, class_info)
+    try:
+        return class_info[attr]
+    except KeyError:
+        info = class_info[attr] = _compute_class_info(kls, attr)
+        return info
+
+
+def _compute_class_info(kls, attr):
+    """
+    Given a class and an attribute name, find the attribute on the class
+    without invoking it, decide whether it is accessible in templates and
+    classify it. The verdict is None for descriptors such as properties and
+    for anything that is not defined on the class, since those must be
+    evaluated on the instance.
+    """
+    # Custom attribute lookup can not be predicted from the class
+    if getattr(kls, '__getattribute__', None) is not \
+            getattr(object, '__getattribute__'):
+        return None, 'attribute'
+    for base in getmro(kls):
+        try:
+            value = base.__dict__[attr]
+        except KeyError:
+            continue
+        break
+    else:
+        return None, 'attribute'
+    if isinstance(value, staticmethod):
+        return _is_valid_routine(value.__get__(None, kls)), 'routine'
+    if isinstance(value, classmethod):
+        return _is_valid_routine(value.__func__, unbound=True), 'routine'
+    classification = _classify_descriptor(value)
+    if classification is not None:
+        return None, classification
+    if isroutine(value):
+        return _is_valid_routine(value, unbound=True), 'routine'
+    if hasattr(type(value), '__get__'):
+        return None, 'descriptor'
+    return True, 'attribute'
+
+
+def _classify_descriptor(value):
+    """
+    Given an attribute found on a class, return its classification if it is
+    a known kind of descriptor, otherwise None
+    """
+    kls = type(value)
+    if isinstance(value, property):
+        return 'property'
+    if kls.__name__ == 'cached_property':
+        return 'cached_property'
+    if kls.__name__ == 'DeferredAttribute':
+        return 'deferred'
+    if getattr(kls, '__module__', '').startswith(RELATED_MODULES):
+        return 'related'
+    return None
@@ -0,0 +1,79 @@
+"""
+Views of the debug output collected per request by CollectorMiddleware.
+"""
+
+from __future__ import unicode_literals
+from pprint import pformat
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.shortcuts import render
+
+from template_debug.collector import get_store
+from template_debug.utils import string_types
+
+
+def _check_enabled(request):
+    """
+    Raise Http404 unless TEMPLATE_DEBUG is on, and PermissionDenied unless
+    the user is staff or the request comes from one of the INTERNAL_IPS, as
+    the output of the tags shows the values of variables. Leave out the
+    request from those collected.
+    """
+    if not getattr(settings, 'TEMPLATE_DEBUG', False):
+        raise Http404
+    user = getattr(request, 'user', None)
+    if not getattr(user, 'is_staff', False) and \
+            request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise PermissionDenied
+    request.template_debug_ignore = True
+
+
+def request_list(request):
+    """List the most recent requests with their timing and query counts"""
+    _check_enabled(request)
+    return render(request, 'template_debug/request_list.html', {
+        'requests': get_store().requests(),
+    })
+
+
+def request_detail(request, request_id):
+    """
+    Show the output of the debug tags for one request, formatting each record
+    now rather than when it was emitted
+    """
+    _check_enabled(request)
+    request_records = get_store().get(int(request_id))
+    if request_records is None:
+        raise Http404
+    records = [{
+        'tag': record.tag,
+        'lines': [line if isinstance(line, string_types) else pformat(line)
+                  for line in record.lines()],
+    } for record in request_records.records]
+    timings = sorted(request_records.timings.items(),
+                     key=lambda timing: timing[1], reverse=True)
+    return render(request, 'template_debug/request_detail.html', {
+        'request_records': request_records,
+        'records': records,
+        'timings': [(key, duration / 1e6) for key, duration in timings],
+        'processors': [dict(processor, milliseconds=processor['duration'] / 1e6)
+                       for processor in request_records.processors],
+        'render_trees': [_get_tree_rows(root)
+                         for root in request_records.render_trees],
+    })
+
+
+def _get_tree_rows(root):
+    """
+    Given the RenderNode at the root of a render tree, return a dictionary for
+    each of its nodes with its indentation and times in milliseconds
+    """
+    return [{
+        'node': node,
+        'indent': depth * 2,
+        'inclusive': node.duration / 1e6,
+        'exclusive': node.exclusive / 1e6,
+        'load_time': None if node.load_time is None else node.load_time / 1e6,
+    } for depth, node in root.walk()]